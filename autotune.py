@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from index_runs import find_runs, load_run
+from simulator import PeltierPlant, simulate_batch, rank
+
+GAINS_FILE = 'gains.json'
+
+def resample(columns, step=None):
+    """Return (step, voltage, temperature) of a run on a uniform time grid, or None if unusable"""
+    import numpy as np
+    seconds = columns['Timestamp'] - columns['Timestamp'][0]
+    temperature = columns['Temperature']
+    valid = ~np.isnan(temperature)
+    if valid.sum() < 10:
+        return None
+    if step is None:
+        step = float(np.median(np.diff(seconds)))
+    grid = np.arange(seconds[valid][0], seconds[valid][-1], step)
+    # The set voltage is held between writes, the temperature is continuous
+    index = np.searchsorted(seconds, grid, side='right') - 1
+    voltage = columns['Set_Voltage'][index]
+    return step, voltage, np.interp(grid, seconds[valid], temperature[valid])
+
+def fit_fopdt(runs, max_dead_time=10.0):
+    """Least-squares fit of a first-order-plus-dead-time model to logged step responses.
+
+    runs is a list of column dicts as returned by load_run. For each whole
+    sample dead time d the ARX model T[k+1] = a T[k] + b u[k-d] + c_run is
+    solved by linear least squares, with one ambient term per run, and the d
+    with the smallest residual wins.
+    """
+    import numpy as np
+    step = None
+    series = []
+    for columns in runs:
+        resampled = resample(columns, step)
+        if resampled is None:
+            continue
+        step, voltage, temperature = resampled
+        series.append((voltage, temperature))
+    if not series:
+        raise ValueError("No usable runs to fit")
+
+    best = None
+    for delay in range(int(max_dead_time / step) + 1):
+        rows, targets = [], []
+        for i, (voltage, temperature) in enumerate(series):
+            n = len(temperature) - 1 - delay
+            if n <= 0:
+                continue
+            block = np.zeros((n, 2 + len(series)))
+            block[:, 0] = temperature[delay:-1]
+            block[:, 1] = voltage[:n]
+            block[:, 2 + i] = 1.0
+            rows.append(block)
+            targets.append(temperature[delay + 1:])
+        if not rows:
+            break
+        A = np.vstack(rows)
+        y = np.concatenate(targets)
+        coef, _, _, _ = np.linalg.lstsq(A, y, rcond=None)
+        sse = float(np.sum((A @ coef - y) ** 2))
+        if best is None or sse < best[0]:
+            best = (sse, delay, coef, len(y))
+
+    sse, delay, coef, n = best
+    a, b = coef[0], coef[1]
+    if not 0 < a < 1:
+        raise ValueError(f"Fitted model is not a stable first-order lag (a={a:.4f})")
+    ambients = coef[2:] / (1 - a)
+    return {
+        'ambient': float(np.mean(ambients)),
+        'gain': float(b / (1 - a)),
+        'tau': float(-step / np.log(a)),
+        'dead_time': float(delay * step),
+        'rms_residual': float(np.sqrt(sse / n)),
+        'runs': len(series)
+    }
+
+def fit_feedforward(runs, fit, points=13):
+    """Learn the steady-state temperature change per voltage from logged runs.
+
+    With the fitted time constant, the temperature a sample is heading for
+    is T + tau dT/dt; it is paired with the voltage applied dead_time
+    earlier. A quadratic through the origin is fitted to these pairs, so the
+    Joule heating that flattens the cooling at high voltage is kept, and
+    sampled at points voltages up to the highest logged voltage, or up to
+    the voltage of maximum cooling if that comes first.
+    """
+    import numpy as np
+    step = None
+    voltages, deltas = [], []
+    for columns in runs:
+        resampled = resample(columns, step)
+        if resampled is None:
+            continue
+        step, voltage, temperature = resampled
+        delay = int(round(fit['dead_time'] / step))
+        if len(temperature) <= delay + 2:
+            continue
+        heading = temperature + fit['tau'] * np.gradient(temperature, step)
+        # Runs start from ambient with the output off
+        voltages.append(voltage[:len(voltage) - delay])
+        deltas.append(heading[delay:] - temperature[0])
+    if not voltages:
+        raise ValueError("No usable runs to fit")
+
+    u = np.concatenate(voltages)
+    d = np.concatenate(deltas)
+    A = np.column_stack([u, u ** 2])
+    (linear, quadratic), _, _, _ = np.linalg.lstsq(A, d, rcond=None)
+    limit = float(u.max())
+    if quadratic and 0 < -linear / (2 * quadratic) < limit:
+        limit = float(-linear / (2 * quadratic))
+    grid = np.linspace(0.0, limit, points)
+    return {
+        'ambient': fit['ambient'],
+        'voltage': grid.tolist(),
+        'delta': (linear * grid + quadratic * grid ** 2).tolist(),
+        'rms_residual': float(np.sqrt(np.mean((A @ [linear, quadratic] - d) ** 2)))
+    }
+
+def _evaluate(kp, ki, kd, plant_params, kwargs):
+    """Worker: simulate one chunk of candidates"""
+    return simulate_batch(kp, ki, kd, plant=PeltierPlant(**plant_params), **kwargs)
+
+def optimise(plant_params, kp, ki, kd, cost='iae', workers=None, **kwargs):
+    """Spread the candidates over a process pool, one vectorized chunk per worker, and rank them"""
+    import numpy as np
+    workers = workers or os.cpu_count() or 1
+    chunks = [np.array_split(np.ravel(values), workers) for values in (kp, ki, kd)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_evaluate, chunks[0][i], chunks[1][i], chunks[2][i], plant_params, kwargs)
+                   for i in range(workers) if len(chunks[0][i])]
+        parts = [future.result() for future in futures]
+    return rank({name: np.concatenate([part[name] for part in parts]) for name in parts[0]}, cost)
+
+def autotune(runs, **kwargs):
+    """Fit the plant to logged runs, then grid search and refine the PID gains on it"""
+    fit = fit_fopdt(runs)
+    plant_params = {name: fit[name] for name in ('ambient', 'gain', 'tau', 'dead_time')}
+    return fit, tune(plant_params, **kwargs)
+
+def tune(plant_params, kp_range=(0.05, 3.0), ki_range=(0.0, 0.3), kd_range=(0.0, 2.0), grid=(30, 16, 11),
+         refine=20000, cost='iae', workers=None, seed=None, **kwargs):
+    """Grid search and refine the PID gains on a plant model, best first"""
+    import numpy as np
+    kp, ki, kd = np.meshgrid(np.linspace(*kp_range, grid[0]), np.linspace(*ki_range, grid[1]),
+                             np.linspace(*kd_range, grid[2]), indexing='ij')
+    results = optimise(plant_params, kp, ki, kd, cost, workers, **kwargs)
+
+    if refine:
+        # Second pass: random candidates within +-25% of the ten best grid points
+        rng = np.random.default_rng(seed)
+        picks = rng.integers(0, min(10, len(results['kp'])), refine)
+        scale = rng.uniform(0.75, 1.25, (3, refine))
+        refined = optimise(plant_params, results['kp'][picks] * scale[0], results['ki'][picks] * scale[1],
+                           results['kd'][picks] * scale[2], cost, workers, **kwargs)
+        results = rank({name: np.concatenate([results[name], refined[name]]) for name in results}, cost)
+    return results
+
+def schedule_gains(fit, feedforward, setpoints, step=2.0, **kwargs):
+    """Tune gains at each setpoint on the plant linearised there, as a gain schedule.
+
+    The local gain is the slope of the feedforward map at the voltage that
+    holds the setpoint; each candidate is scored on a step of step °C onto
+    the setpoint from above.
+    """
+    import numpy as np
+    voltages = np.array(feedforward['voltage'])
+    deltas = np.array(feedforward['delta'])
+    slopes = np.gradient(deltas, voltages)
+    points = []
+    for setpoint in setpoints:
+        order = np.argsort(deltas)
+        voltage = float(np.interp(setpoint - feedforward['ambient'], deltas[order], voltages[order]))
+        gain = float(np.interp(voltage, voltages, slopes))
+        plant_params = {'ambient': setpoint + step, 'gain': gain, 'tau': fit['tau'], 'dead_time': fit['dead_time']}
+        results = tune(plant_params, target=setpoint, **kwargs)
+        points.append({'temperature': setpoint, 'gain': gain, 'kp': float(results['kp'][0]),
+                       'ki': float(results['ki'][0]), 'kd': float(results['kd'][0])})
+    return {'key': 'setpoint', 'points': points}
+
+def write_gains(path, fit, results, cost, target, period, top=20, feedforward=None, schedule=None):
+    """Write the ranked gains file read by pid_utils.load_gains and pid_utils.load_model"""
+    fields = ['kp', 'ki', 'kd', 'iae', 'ise', 'overshoot', 'settling_time', 'final_temperature']
+    gains = []
+    for i in range(min(top, len(results['kp']))):
+        entry = {name: float(results[name][i]) for name in fields}
+        if entry['settling_time'] == float('inf'):
+            entry['settling_time'] = None
+        gains.append(entry)
+    with open(path, 'w') as f:
+        json.dump({'plant': fit, 'feedforward': feedforward, 'schedule': schedule, 'cost': cost, 'target': target,
+                   'period': period, 'gains': gains}, f, indent=2)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit the Peltier model to logged runs and rank PID gains')
+    parser.add_argument('root', nargs='?', default='logs', help='folder containing measurements_* runs')
+    parser.add_argument('--output', default=GAINS_FILE)
+    parser.add_argument('--target', type=float, default=20.0)
+    parser.add_argument('--period', type=float, default=1.0, help='control period the gains are tuned for')
+    parser.add_argument('--duration', type=float, default=300.0)
+    parser.add_argument('--cost', default='iae', choices=['iae', 'ise', 'overshoot', 'settling_time'])
+    parser.add_argument('--refine', type=int, default=20000, help='random refinement candidates, 0 to skip')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--schedule', type=lambda text: [float(t) for t in text.split(',')], metavar='T1,T2,...',
+                        help='also tune a gain schedule at these setpoints (needs the feedforward map)')
+    args = parser.parse_args(argv)
+
+    runs = []
+    for path in find_runs(args.root):
+        try:
+            runs.append(load_run(path)[1])
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+
+    start = time.perf_counter()
+    fit, results = autotune(runs, cost=args.cost, workers=args.workers, refine=args.refine,
+                            target=args.target, duration=args.duration, period=args.period)
+    print(f"Plant fit over {fit['runs']} runs: gain {fit['gain']:.3f} °C/V, tau {fit['tau']:.1f}s, "
+          f"dead time {fit['dead_time']:.1f}s, ambient {fit['ambient']:.2f}°C, "
+          f"residual {fit['rms_residual']:.3f}°C")
+    try:
+        feedforward = fit_feedforward(runs, fit)
+        print(f"Feedforward map: {feedforward['delta'][-1]:+.2f}°C at {feedforward['voltage'][-1]:.2f}V, "
+              f"residual {feedforward['rms_residual']:.3f}°C")
+    except ValueError as e:
+        print(f"No feedforward map: {e}")
+        feedforward = None
+    print(f"Evaluated {len(results['kp'])} candidates in {time.perf_counter() - start:.2f}s")
+    for i in range(min(5, len(results['kp']))):
+        print(f"  Kp={results['kp'][i]:.3f} Ki={results['ki'][i]:.4f} Kd={results['kd'][i]:.3f} "
+              f"{args.cost}={results[args.cost][i]:.2f}")
+    schedule = None
+    if args.schedule and feedforward:
+        schedule = schedule_gains(fit, feedforward, args.schedule, cost=args.cost, workers=args.workers,
+                                  refine=args.refine, duration=args.duration, period=args.period)
+        for point in schedule['points']:
+            print(f"  {point['temperature']:.1f}°C (gain {point['gain']:.2f} °C/V): Kp={point['kp']:.3f} "
+                  f"Ki={point['ki']:.4f} Kd={point['kd']:.3f}")
+    write_gains(args.output, fit, results, args.cost, args.target, args.period, args.top, feedforward, schedule)
+    print(f"Ranked gains saved to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
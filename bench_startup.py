@@ -0,0 +1,55 @@
+import os
+import sys
+import argparse
+import subprocess
+
+# Modules the control loop must not pay for at startup
+HEAVY_MODULES = ['pandas', 'matplotlib', 'numpy', 'pyvisa', 'openpyxl']
+
+def import_times(module, cwd):
+    """Run 'python -X importtime -c import module' and return {name: (self_us, cumulative_us)}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the import time of the controller against a budget')
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--budget', type=float, default=150.0, help='allowed import time in ms')
+    parser.add_argument('--runs', type=int, default=5, help='the best of this many runs is used')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(args.runs):
+        times = import_times(args.module, cwd)
+        if best is None or times[args.module][1] < best[args.module][1]:
+            best = times
+
+    total_ms = best[args.module][1] / 1000
+    print(f"import {args.module}: {total_ms:.1f}ms (budget {args.budget:.0f}ms, best of {args.runs})")
+    print("Slowest modules (self time):")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:7.1f}ms  {name}")
+
+    failed = False
+    heavy = [name for name in HEAVY_MODULES if name in best]
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)}")
+        failed = True
+    if total_ms > args.budget:
+        print(f"FAIL: startup over budget by {total_ms - args.budget:.1f}ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
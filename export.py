@@ -0,0 +1,58 @@
+import os
+import sys
+import argparse
+import subprocess
+from run_archive import ARCHIVE_FILE
+
+LOG_FILE = 'power_supply_temp_log.csv'
+
+def find_data(output_folder):
+    """Return the run archive of a run folder, or its streamed CSV log if there is no archive"""
+    for name in (ARCHIVE_FILE, LOG_FILE):
+        path = os.path.join(output_folder, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+def export_run(output_folder, error=False, preview=False, dpi=None):
+    """Write the Excel file and plots of a finished run"""
+    import pandas as pd
+    from index_runs import load_run
+    from pid_utils import epoch_to_local, save_data
+
+    path = find_data(output_folder)
+    if path is None:
+        return None, None
+    _, columns = load_run(path)
+    df = pd.DataFrame(columns)
+    df['Timestamp'] = epoch_to_local(df['Timestamp'])
+    return save_data(df, output_folder, error=error, preview=preview, dpi=dpi)
+
+def start_export(output_folder, error=False, preview=False):
+    """Run export.py for a run folder in a separate process and return without waiting"""
+    command = [sys.executable, os.path.abspath(__file__), output_folder]
+    if error:
+        command.append('--error')
+    if preview:
+        command.append('--preview')
+    return subprocess.Popen(command, start_new_session=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the Excel file and plots of a finished run')
+    parser.add_argument('folders', nargs='+', help='run folders (measurements_*)')
+    parser.add_argument('--error', action='store_true', help='mark the output as a partial run')
+    parser.add_argument('--preview', action='store_true', help='fast low resolution plots with fewer points')
+    parser.add_argument('--dpi', type=int, help='plot resolution')
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        excel_file, plot_file = export_run(folder, args.error, args.preview, args.dpi)
+        if excel_file is None:
+            print(f"No data found in {folder}")
+            continue
+        print(f"Data saved to: {excel_file}")
+        print(f"Plots saved to: {plot_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import os
+import sys
+import math
+import time
+import sqlite3
+import argparse
+from pid_utils import local_to_epoch
+from run_archive import ARCHIVE_FILE, ARCHIVE_PARAMS, load_archive
+
+INDEX_FILE = 'run_index.sqlite'
+DEFAULT_TARGET = 20.0  # TARGET_TEMPERATURE in main.py, used when a log does not record it
+
+RUN_FIELDS = ['folder', 'source', 'rows', 'start_time', 'duration', 'target_temperature', 'kp', 'ki', 'kd',
+              'voltage_limit', 'rate', 'band', 'final_temperature', 'settling_time', 'overshoot',
+              'rms_error', 'energy']
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    {', '.join(RUN_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS runs_gains ON runs (kp, ki, kd);
+CREATE INDEX IF NOT EXISTS runs_settling ON runs (settling_time);
+'''
+
+def find_runs(root):
+    """Yield the best data file of every measurement folder below root"""
+    for folder, _, files in sorted(os.walk(root)):
+        if not os.path.basename(folder).startswith('measurements_'):
+            continue
+        names = set(files)
+        if ARCHIVE_FILE in names:
+            yield os.path.join(folder, ARCHIVE_FILE)
+            continue
+        for prefix, ext in (('power_supply_temp_log', '.csv'), ('power_supply_temp_log', '.xlsx')):
+            candidates = sorted(n for n in names if n.startswith(prefix) and n.endswith(ext))
+            if candidates:
+                yield os.path.join(folder, candidates[0])
+                break
+
+def load_run(path):
+    """Return (params, columns) for an archive, streamed CSV or Excel log"""
+    if path.endswith('.pidrun'):
+        return load_archive(path)
+
+    import pandas as pd
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, skipinitialspace=True)
+        timestamps = df['Timestamp'].to_numpy(dtype=float)
+    else:
+        df = pd.read_excel(path)
+        timestamps = local_to_epoch(df['Timestamp'])
+    columns = {name: df[name].to_numpy(dtype=float) for name in df.columns if name != 'Timestamp'}
+    columns['Timestamp'] = timestamps
+    return {name: math.nan for name in ARCHIVE_PARAMS}, columns
+
+def run_metrics(seconds, temperature, voltage, current, target, band):
+    """Summary statistics of one run, times in seconds from the first sample"""
+    import numpy as np
+    valid = ~np.isnan(temperature)
+    if not valid.any():
+        return {'final_temperature': None, 'settling_time': None, 'overshoot': None, 'rms_error': None,
+                'energy': None}
+
+    t = seconds[valid]
+    temp = temperature[valid]
+    error = temp - target
+
+    # Settled means inside the band from some point on until the end of the run
+    outside = np.flatnonzero(np.abs(error) > band)
+    if len(outside) == 0:
+        settling_time = float(t[0])
+    elif outside[-1] == len(temp) - 1:
+        settling_time = None
+    else:
+        settling_time = float(t[outside[-1] + 1])
+
+    # Overshoot is measured past the target in the direction of approach
+    if temp[0] > target:
+        overshoot = max(0.0, target - float(temp.min()))
+    else:
+        overshoot = max(0.0, float(temp.max()) - target)
+
+    power = np.nan_to_num(voltage * current)
+    energy = float(np.sum((power[1:] + power[:-1]) / 2 * np.diff(seconds))) if len(seconds) > 1 else 0.0
+
+    return {
+        'final_temperature': float(temp[-1]),
+        'settling_time': settling_time,
+        'overshoot': overshoot,
+        'rms_error': float(np.sqrt(np.mean(error ** 2))),
+        'energy': energy
+    }
+
+def summarise(path, default_target, band):
+    """Build the index row for one run"""
+    params, columns = load_run(path)
+    params = {name: (None if math.isnan(value) else value) for name, value in params.items()}
+    timestamps = columns['Timestamp']
+    rows = len(timestamps)
+    target = params['target_temperature'] if params['target_temperature'] is not None else default_target
+    seconds = timestamps - timestamps[0] if rows else timestamps
+
+    summary = {
+        'folder': os.path.basename(os.path.dirname(path)),
+        'source': os.path.basename(path),
+        'rows': rows,
+        'start_time': float(timestamps[0]) if rows else params['start_time'],
+        'duration': float(seconds[-1]) if rows else 0.0,
+        'target_temperature': target,
+        'kp': params['kp'],
+        'ki': params['ki'],
+        'kd': params['kd'],
+        'voltage_limit': params['voltage_limit'],
+        'rate': params['rate'],
+        'band': band
+    }
+    if rows:
+        summary.update(run_metrics(seconds, columns['Temperature'], columns['Measured_Voltage'],
+                                   columns['Measured_Current'], target, band))
+    return summary
+
+def open_index(db_file):
+    """Open the index database, creating the schema if needed"""
+    db = sqlite3.connect(db_file)
+    db.executescript(SCHEMA)
+    return db
+
+def scan(root, db_file, default_target=DEFAULT_TARGET, band=0.5):
+    """Index new and changed runs below root; unchanged files are skipped by mtime and size"""
+    db = open_index(db_file)
+    known = {path: (mtime, size, row_band)
+             for path, mtime, size, row_band in db.execute('SELECT path, mtime, size, band FROM runs')}
+    seen = set()
+    added = updated = 0
+
+    for path in find_runs(root):
+        seen.add(path)
+        stat = os.stat(path)
+        if known.get(path) == (stat.st_mtime, stat.st_size, band):
+            continue
+        try:
+            summary = summarise(path, default_target, band)
+        except Exception as e:
+            print(f"Error indexing {path}: {e}")
+            continue
+        db.execute(f'INSERT OR REPLACE INTO runs (path, mtime, size, {", ".join(RUN_FIELDS)}) '
+                   f'VALUES ({", ".join("?" * (len(RUN_FIELDS) + 3))})',
+                   [path, stat.st_mtime, stat.st_size] + [summary.get(name) for name in RUN_FIELDS])
+        if path in known:
+            updated += 1
+        else:
+            added += 1
+
+    removed = [path for path in known if path not in seen]
+    db.executemany('DELETE FROM runs WHERE path = ?', [(path,) for path in removed])
+    db.commit()
+    db.close()
+    return added, updated, len(removed)
+
+def query(db_file, kp=None, ki=None, kd=None, target=None, settled_within=None, where=None, order='start_time'):
+    """Return matching runs as a list of dicts"""
+    clauses = []
+    values = []
+    for column, value in (('kp', kp), ('ki', ki), ('kd', kd), ('target_temperature', target)):
+        if value is not None:
+            clauses.append(f'abs({column} - ?) < 1e-9')
+            values.append(value)
+    if settled_within is not None:
+        clauses.append('settling_time IS NOT NULL AND settling_time <= ?')
+        values.append(settled_within)
+    if where:
+        clauses.append(f'({where})')
+
+    sql = 'SELECT path, ' + ', '.join(RUN_FIELDS) + ' FROM runs'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += f' ORDER BY {order}'
+
+    db = open_index(db_file)
+    db.row_factory = sqlite3.Row
+    rows = [dict(row) for row in db.execute(sql, values)]
+    db.close()
+    return rows
+
+def format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.3f}'
+    return str(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index measurement folders and query run statistics')
+    parser.add_argument('--db', help=f'index database (default: <root>/{INDEX_FILE})')
+    parser.add_argument('--root', default='logs', help='folder containing measurements_* runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan_cmd = commands.add_parser('scan', help='index new and changed runs')
+    scan_cmd.add_argument('--target', type=float, default=DEFAULT_TARGET,
+                          help='target temperature for logs that do not record one')
+    scan_cmd.add_argument('--band', type=float, default=0.5, help='settling band in °C')
+
+    query_cmd = commands.add_parser('query', help='list indexed runs')
+    query_cmd.add_argument('--kp', type=float)
+    query_cmd.add_argument('--ki', type=float)
+    query_cmd.add_argument('--kd', type=float)
+    query_cmd.add_argument('--target', type=float)
+    query_cmd.add_argument('--settled-within', type=float, help='seconds')
+    query_cmd.add_argument('--where', help='extra SQL condition on the runs table')
+    query_cmd.add_argument('--order', default='start_time')
+
+    args = parser.parse_args(argv)
+    db_file = args.db or os.path.join(args.root, INDEX_FILE)
+
+    if args.command == 'scan':
+        start = time.perf_counter()
+        added, updated, removed = scan(args.root, db_file, args.target, args.band)
+        print(f"Indexed {added} new, {updated} changed, {removed} removed runs "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        start = time.perf_counter()
+        rows = query(db_file, args.kp, args.ki, args.kd, args.target, args.settled_within, args.where, args.order)
+        elapsed = time.perf_counter() - start
+        columns = ['folder', 'duration', 'target_temperature', 'kp', 'ki', 'kd', 'final_temperature',
+                   'settling_time', 'overshoot', 'rms_error', 'energy']
+        print('\t'.join(columns))
+        for row in rows:
+            print('\t'.join(format_value(row[name]) for name in columns))
+        print(f"{len(rows)} runs in {elapsed * 1000:.1f}ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import json
+from pid_utils import PT100TempLogger, PT100StreamReader, PowerSupply
+
+PORT_CACHE = 'instrument_ports.json'
+
+# Device name -> text looked for in the port description the first time it is seen
+DEVICES = {
+    'sensor': 'ch340',  # write the name of your arduino device name
+    'supply': 'PL2303GT'  # write the name of your power supply device name
+}
+
+def port_identity(port):
+    """The USB identity of a serial port, which survives it being renumbered"""
+    return {'vid': port.vid, 'pid': port.pid, 'serial_number': port.serial_number}
+
+class InstrumentManager:
+    def __init__(self, devices=DEVICES, cache_file=PORT_CACHE):
+        """Find, open and reopen the Arduino and the power supply.
+
+        Ports are enumerated once. A device found by its description is
+        remembered in cache_file by USB VID/PID and serial number, so the next
+        run finds it directly even if the port name or description changed.
+        The sensor and supply it opens reconnect by themselves, looking their
+        port up again, when the link drops.
+        """
+        self.devices = devices
+        self.cache_file = cache_file
+        self.identities = {}
+        self.rm = None
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.identities = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring port cache {cache_file}: {e}")
+        self.ports = self.discover()
+
+    def discover(self):
+        """Return {device name: port} for every device present"""
+        import serial.tools.list_ports
+        available = serial.tools.list_ports.comports()
+        ports = {}
+        changed = False
+        for name, description in self.devices.items():
+            identity = self.identities.get(name)
+            port = None
+            if identity:
+                port = next((p for p in available if port_identity(p) == identity), None)
+            if port is None:
+                port = next((p for p in available if description.lower() in str(p.description).lower()), None)
+                if port is not None and port.vid is not None and port_identity(port) != identity:
+                    self.identities[name] = port_identity(port)
+                    changed = True
+            ports[name] = port.device if port else None
+            print(f"{name.capitalize()} port: {ports[name]}" if port else f"No {description} device found")
+        if changed:
+            try:
+                with open(self.cache_file, 'w') as f:
+                    json.dump(self.identities, f, indent=2)
+            except OSError as e:
+                print(f"Error writing port cache {self.cache_file}: {e}")
+        return ports
+
+    def locate(self, name):
+        """Enumerate the ports again and return the current port of a device"""
+        self.ports = self.discover()
+        return self.ports[name]
+
+    def open_sensor(self, mode='poll', period_ms=100):
+        """Open the PT100 Arduino, polled ('poll') or streaming binary frames ('stream')"""
+        locate = lambda: self.locate('sensor')
+        if mode == 'stream':
+            return PT100StreamReader(self.ports['sensor'], period_ms=period_ms, locate=locate)
+        return PT100TempLogger(self.ports['sensor'], locate=locate)
+
+    def open_supply(self):
+        """Open the power supply, reset it and put it in remote mode"""
+        import pyvisa
+        if self.rm is None:
+            self.rm = pyvisa.ResourceManager()
+        ps = PowerSupply(self.rm.open_resource(self.ports['supply']),
+                         opener=lambda: self.rm.open_resource(self.locate('supply')))
+        ps.reset()
+        return ps
+
+    def close(self):
+        if self.rm:
+            try:
+                self.rm.close()
+            except Exception:
+                pass
@@ -1,95 +1,182 @@
-import pyvisa
 import time
 import os
 from datetime import datetime
 import signal
 import sys
-from pid_utils import PT100TempLogger, save_data, pid_control
-import serial.tools.list_ports
+import argparse
+from pid_utils import PT100StreamReader, BackgroundTempReader, SignalConditioner, LoopScheduler, StageTimer, PowerSupply, ConcurrentIO, StreamingLogWriter, MeasurementStore, load_gains, load_model, load_schedule, PID, ModelController, RLSTuner
+from instruments import InstrumentManager
+from setpoint_profile import Profile, load_profile
+from run_archive import ARCHIVE_FILE, write_archive
+from export import export_run, start_export
+from telemetry import Telemetry
+from simulator import PeltierPlant, SimClock, SimPowerSupply, SimTempLogger
 
 def signal_handler(signum, frame):
     """Handle keyboard interrupts and system signals"""
     print("\nSignal received. Saving data and shutting down...")
     raise KeyboardInterrupt
 
-def control_power_supply_with_temp_monitoring():
+def control_power_supply_with_temp_monitoring(simulate=False, gains_file=None, telemetry_port=8765, profile_file=None,
+                                              mode='pid', schedule_file=None, adapt=False):
     # Initialize signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_folder = f'measurements_{timestamp}'
+    output_folder = f'simulation_{timestamp}' if simulate else f'measurements_{timestamp}'
     os.makedirs(output_folder, exist_ok=True)
     
     temp_logger = None
+    temp_reader = None
+    sensor = None
     ps = None
-    rm = None
-    data = []
+    instruments = None
+    clock = time
+    log_writer = None
+    log_file = os.path.join(output_folder, 'power_supply_temp_log.csv')
+    data = MeasurementStore()
     
     TARGET_TEMPERATURE = 20.0
+    CONTROL_DIRECTION = -1  # The Peltier cools as the voltage rises, see PID
+    CONTROL_PERIOD = 1.0  # Seconds per control cycle, the sample interval the PID gains assume
+    SCHEDULE_POLICY = 'skip'  # 'skip' drops missed cycles, 'catchup' runs them back-to-back
+    SENSOR_MODE = 'poll'  # 'poll' asks for one reading per cycle, 'stream' uses the binary frame stream
+    STREAM_PERIOD_MS = 100
+    BACKGROUND_READER = True  # Acquire temperatures on a thread so the loop never waits on the port
+    SENSOR_FILTER = 'median'  # None, 'median', 'ema' or 'kalman', after fault and spike rejection
+    FSYNC_INTERVAL = 10.0  # Seconds between forced writes of the log to disk, None to leave it to the OS
+    DEFERRED_EXPORT = True  # Write Excel and plots in a separate process once the output is off
+    EXPORT_PREVIEW = False  # Quick low resolution plots, for long runs
+    ADAPT_DEAD_TIME = 2.0  # Seconds, used by --adapt when no plant fit is given with --gains
+    CONSOLE_INTERVAL = 10.0  # Seconds between console status lines, the full state is on the telemetry endpoint
+    MAX_MISSING_READINGS = 10  # Cycles in a row without a temperature, past the filter's hold, before the run stops
+    error = False
     reading_counter = 0
+    missing_readings = 0
     target_reached = False
     
+    target_voltage = 6.0  # To limit power supply
+    rate = 0.05
+    duration = 120
+    
     # PID parameters
     Kp, Ki, Kd = 0.65, 0.01, 0.05
-    integral = 0
-    prev_error = 0
+    if gains_file:
+        Kp, Ki, Kd, tuned_period = load_gains(gains_file)
+        print(f"Loaded gains from {gains_file}: Kp={Kp:.3f}, Ki={Ki:.4f}, Kd={Kd:.3f}")
+        if tuned_period != CONTROL_PERIOD:
+            print(f"Warning: gains were tuned for a {tuned_period}s period, the loop runs at {CONTROL_PERIOD}s")
+    # 'pid' is plain PID, 'feedforward' adds the learned voltage map, 'smith' also compensates the dead time
+    controller = PID(Kp, Ki, Kd, CONTROL_DIRECTION)
+    if mode != 'pid':
+        plant, feedforward = load_model(gains_file) if gains_file else (None, None)
+        if plant is None or feedforward is None:
+            raise ValueError(f"Mode {mode} needs a gains file with a plant fit and a feedforward map, run autotune.py")
+        controller = ModelController(controller, feedforward, plant, smith=mode == 'smith')
+        print(f"Controller mode: {mode}")
+    # Gains follow the operating point from a table, or are retuned from an online plant estimate
+    schedule = load_schedule(schedule_file) if schedule_file else None
+    tuner = None
+    if adapt:
+        plant = load_model(gains_file)[0] if gains_file else None
+        tuner = RLSTuner(CONTROL_PERIOD, plant['dead_time'] if plant else ADAPT_DEAD_TIME, CONTROL_DIRECTION)
+    setpoint = TARGET_TEMPERATURE
+    # With a profile the PID follows its setpoint from the first reading, there is no voltage ramp
+    profile_spec = load_profile(profile_file) if profile_file else None
+    profile = None
+    profile_start = 0
+    scheduler = None
+    io = None
+    telemetry = None
+    timer = StageTimer()
     
     try:
-        port = next((port.device for port in serial.tools.list_ports.comports() if 'ch340' in port.description.lower()), None)   # write the name of your arduino device name
-        print(f"Arduino device port: {port}" if port else "No CH340 device found")
-        temp_logger = PT100TempLogger(port)
-
-        port2 = next((p.device for p in serial.tools.list_ports.comports() if 'PL2303GT' in str(p.description)), None)   # write the name of your power supply device name
-        print(f"Power supply port: {port2}" if port2 else "No power supply device found")
-        rm = pyvisa.ResourceManager()
-        ps = rm.open_resource(port2)
-        
-        ps.write('*RST')
-        ps.write('SYST:REM')
-        
-        target_voltage = 6.0  # To limit power supply
-        rate = 0.05
-        duration = 120
+        if simulate:
+            plant = PeltierPlant()
+            clock = SimClock(plant)
+            temp_logger = SimTempLogger(plant, clock)
+            temp_reader = temp_logger  # A background reader thread would run in real time
+            ps = PowerSupply(SimPowerSupply(plant, clock))
+            ps.reset()
+            print("Running against the simulated Peltier stage")
+        else:
+            # Ports are cached by USB identity, and both links reconnect by themselves
+            instruments = InstrumentManager()
+            temp_logger = instruments.open_sensor(SENSOR_MODE, STREAM_PERIOD_MS)
+            temp_reader = BackgroundTempReader(temp_logger) if BACKGROUND_READER else temp_logger
+            ps = instruments.open_supply()
         
         voltage_step = rate
         current_voltage = 0
-        start_time = time.time()
+        sensor = SignalConditioner(temp_reader, SENSOR_FILTER, clock=clock)
+        io = ConcurrentIO(sensor, ps, clock, timer=timer)
+        telemetry = Telemetry(port=telemetry_port, console_interval=CONSOLE_INTERVAL)
+        log_writer = StreamingLogWriter(log_file, fsync_interval=FSYNC_INTERVAL)
+        scheduler = LoopScheduler(CONTROL_PERIOD, SCHEDULE_POLICY, clock)
         elapsed_time = 0
         
         while elapsed_time < duration:
-            temperature = temp_logger.read_temperature()
+            cycle_start = stage_start = timer.start()
+
+            # Sensor and supply are read concurrently, so the snapshot is consistent in time
+            snapshot = io.acquire()
+            stage_start = timer.stop('acquire', stage_start)
+            temperature = snapshot['Temperature']
+            actual_voltage = snapshot['Measured_Voltage']
+            actual_current = snapshot['Measured_Current']
+            timestamp = snapshot['Timestamp']
+
+            # Without readings the voltage would be held, or keep ramping, open-loop until the end of the run
+            missing_readings = missing_readings + 1 if temperature is None else 0
+            if missing_readings >= MAX_MISSING_READINGS:
+                raise RuntimeError(f"No temperature reading for {missing_readings} cycles, switching the output off")
+
+            if profile_spec and profile is None and temperature is not None:
+                profile = Profile(profile_spec['segments'], profile_spec.get('start', temperature))
+                profile_start = elapsed_time
+                duration = elapsed_time + profile.duration
+                target_reached = True
+                controller.reset(current_voltage, profile.setpoint(0), temperature, clock.monotonic())
+                print(f"Following {profile_file}: {profile.duration:.0f}s from {profile.start:.2f}°C to {profile.final:.2f}°C")
+            if profile:
+                setpoint = profile.setpoint(elapsed_time - profile_start)
+
+            if tuner and temperature is not None:
+                gains = tuner.update(temperature, current_voltage)
+                if gains:
+                    controller.set_gains(*gains)
+            elif schedule:
+                # A reading of 0.0°C is a real operating point, only a missing one falls back to the setpoint
+                operating_point = temperature if schedule.key != 'setpoint' and temperature is not None else setpoint
+                controller.set_gains(*schedule.gains(operating_point))
 
             if not target_reached:
-                if current_voltage < target_voltage:
+                if current_voltage < target_voltage and not profile_spec:
                     current_voltage = min(current_voltage + voltage_step, target_voltage)
-            else:
-                current_voltage, integral, prev_error = pid_control(
-                    TARGET_TEMPERATURE, temperature, Kp, Ki, Kd, integral, prev_error
-                )
+            elif temperature is not None:
+                current_voltage = controller.update(setpoint, temperature, clock.monotonic())
+            stage_start = timer.stop('compute', stage_start)
 
-            ps.write(f'VOLT {current_voltage:.3f}')
-            ps.write('OUTP ON')
+            io.apply(current_voltage)
+            stage_start = timer.stop('setpoint', stage_start)
             
-            actual_voltage = float(ps.query('MEAS:VOLT?'))
-            actual_current = float(ps.query('MEAS:CURR?'))
-            timestamp = datetime.now()
+            log_writer.write(timestamp, current_voltage, actual_voltage, actual_current, temperature)
+            data.append(timestamp, current_voltage, actual_voltage, actual_current, temperature)
+            stage_start = timer.stop('log', stage_start)
             
-            data.append({
-                'Timestamp': timestamp,
-                'Set_Voltage': current_voltage,
-                'Measured_Voltage': actual_voltage,
-                'Measured_Current': actual_current,
-                'Temperature': temperature
+            telemetry.publish({
+                'timestamp': timestamp,
+                'elapsed': elapsed_time,
+                'target': setpoint,
+                'temperature': temperature,
+                'set_voltage': current_voltage,
+                'measured_voltage': actual_voltage,
+                'measured_current': actual_current,
+                'pid_active': target_reached,
+                'cycles': reading_counter + 1
             })
-            
-            print(f'\nElapsed time: {elapsed_time:.1f}s')
-            print(f'Time: {timestamp.strftime("%H:%M:%S")}')
-            print(f'Set Voltage: {current_voltage:.3f}V')
-            print(f'Measured Voltage: {actual_voltage:.3f}V')
-            print(f'Measured Current: {actual_current:.3f}A')
-            print(f'Temperature: {temperature:.2f}°C' if temperature is not None else 'Temperature: Reading Error')
-            print('-' * 50)
+            timer.stop('telemetry', stage_start)
             
             reading_counter += 1
             if reading_counter > 3 and temperature is not None:
@@ -97,42 +184,69 @@ def control_power_supply_with_temp_monitoring():
                     if not target_reached:
                         print(f"\nTarget temperature {TARGET_TEMPERATURE}°C reached! Switching to PID control.")
                         target_reached = True
+                        # Start the PID from the ramp voltage instead of from zero
+                        controller.reset(current_voltage, TARGET_TEMPERATURE, temperature, clock.monotonic())
+            timer.stop('cycle', cycle_start)
             
-            time.sleep(1)
-            elapsed_time = time.time() - start_time
+            scheduler.wait()
+            elapsed_time = scheduler.elapsed()
 
-        # Normal completion - save data and create plots
-        excel_file, plot_file = save_data(data, output_folder)
         print(f"\nMeasurement complete!")
-        print(f"Data saved to: {excel_file}")
-        print(f"Plots saved to: {plot_file}")
         
     except KeyboardInterrupt:
         print("\nProgram interrupted by user.")
-        excel_file, plot_file = save_data(data, output_folder, error=True)
-        print(f"Partial data saved to: {excel_file}")
-        print(f"Partial plots saved to: {plot_file}")
+        error = True
         
     except Exception as e:
         print(f"An error occurred: {str(e)}")
-        excel_file, plot_file = save_data(data, output_folder, error=True)
-        print(f"Partial data saved to: {excel_file}")
-        print(f"Partial plots saved to: {plot_file}")
+        error = True
     
     finally:
-        # Cleanup resources
+        # Switch the Peltier off first, everything else can wait
+        if io:
+            io.close()
+
         if ps:
             try:
                 ps.write('OUTP OFF')
                 ps.close()
             except:
                 pass
+
+        if isinstance(temp_reader, BackgroundTempReader):
+            temp_reader.stop()
+
+        if telemetry:
+            print(telemetry.summary())
+            telemetry.close()
+
+        if scheduler:
+            stats = scheduler.summary()
+            print(f"Loop timing: {stats['cycles']} cycles, {stats['overruns']} overruns, "
+                  f"{stats['skipped']} skipped, mean jitter {stats['mean_jitter'] * 1000:.1f}ms, "
+                  f"max jitter {stats['max_jitter'] * 1000:.1f}ms")
+            print(f"Power supply: {ps.transactions} SCPI transactions over {stats['cycles']} cycles, "
+                  f"{ps.reconnects} reconnects")
+
+        if timer.counts:
+            print("Stage timing (ms):    count     mean      p50      p99      max")
+            for stage, stats in timer.summary().items():
+                print(f"  {stage:<16}{stats['count']:>9}{stats['mean_ms']:>9.2f}{stats['p50_ms']:>9.2f}"
+                      f"{stats['p99_ms']:>9.2f}{stats['max_ms']:>9.2f}")
+
+        if isinstance(temp_logger, PT100StreamReader):
+            print(f"Sensor stream: {temp_logger.frames} frames, {temp_logger.dropped} dropped, "
+                  f"{temp_logger.crc_errors} CRC errors")
+        if getattr(temp_logger, 'reconnects', 0):
+            print(f"Sensor reconnected {temp_logger.reconnects} times")
+        if getattr(temp_reader, 'errors', 0):
+            print(f"Sensor reader thread recovered from {temp_reader.errors} errors")
+        if sensor:
+            print(f"Sensor readings: {getattr(temp_logger, 'faults', 0)} faults, {sensor.rejected} rejected, "
+                  f"{sensor.held} held")
         
-        if rm:
-            try:
-                rm.close()
-            except:
-                pass
+        if instruments:
+            instruments.close()
             
         if temp_logger:
             try:
@@ -140,5 +254,52 @@ def control_power_supply_with_temp_monitoring():
             except:
                 pass
 
+        if log_writer:
+            log_writer.close()
+
+        if timer.counts:
+            try:
+                timer.write_csv(os.path.join(output_folder, 'stage_timing.csv'))
+            except Exception as e:
+                print(f"Error writing stage timing: {e}")
+
+        if len(data):
+            try:
+                write_archive(os.path.join(output_folder, ARCHIVE_FILE), data.columns, {
+                    'target_temperature': setpoint, 'kp': Kp, 'ki': Ki, 'kd': Kd,
+                    'voltage_limit': target_voltage, 'rate': rate, 'duration': duration
+                })
+            except Exception as e:
+                print(f"Error writing run archive: {e}")
+
+            if DEFERRED_EXPORT:
+                start_export(output_folder, error=error, preview=EXPORT_PREVIEW)
+                print(f"Writing Excel file and plots to {output_folder} in the background")
+            else:
+                excel_file, plot_file = export_run(output_folder, error=error, preview=EXPORT_PREVIEW)
+                print(f"{'Partial data' if error else 'Data'} saved to: {excel_file}")
+                print(f"{'Partial plots' if error else 'Plots'} saved to: {plot_file}")
+
 if __name__ == "__main__":
-    control_power_supply_with_temp_monitoring()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Peltier temperature control with PT100 feedback')
+    parser.add_argument('--simulate', action='store_true',
+                        help='run against the simulated Peltier stage instead of the bench, faster than real time')
+    parser.add_argument('--gains', metavar='FILE', help='use the best entry of a gains file written by autotune.py')
+    parser.add_argument('--telemetry-port', type=int, default=8765,
+                        help='port of the local JSON/Prometheus endpoint, 0 to disable')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='follow the setpoint schedule in FILE instead of ramping to TARGET_TEMPERATURE')
+    parser.add_argument('--mode', choices=['pid', 'feedforward', 'smith'], default='pid',
+                        help='add feedforward from the map in the --gains file, and Smith-predictor dead-time compensation')
+    tuning = parser.add_mutually_exclusive_group()
+    tuning.add_argument('--schedule', metavar='FILE',
+                        help='gain schedule by setpoint or temperature, a table or a gains file from autotune.py --schedule')
+    tuning.add_argument('--adapt', action='store_true',
+                        help='retune the gains online from a recursive least-squares fit of the plant')
+    args = parser.parse_args()
+    if args.mode != 'pid' and not args.gains:
+        parser.error(f'--mode {args.mode} needs --gains with a file written by autotune.py')
+    control_power_supply_with_temp_monitoring(simulate=args.simulate, gains_file=args.gains,
+                                              telemetry_port=args.telemetry_port or None,
+                                              profile_file=args.profile, mode=args.mode, schedule_file=args.schedule,
+                                              adapt=args.adapt)
\ No newline at end of file
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from pid_utils import PT100TempLogger, BackgroundTempReader, LoopScheduler, PowerSupply, ConcurrentIO, StreamingLogWriter, MeasurementStore, PID
+from run_archive import ARCHIVE_FILE, write_archive
+from export import start_export
+from telemetry import Telemetry
+from simulator import PeltierPlant, SimClock, SimPowerSupply, SimTempLogger
+
+CHANNEL_DEFAULTS = {
+    'target': 20.0,
+    'kp': 0.65,
+    'ki': 0.01,
+    'kd': 0.05,
+    'direction': -1,
+    'voltage_limit': 6.0,
+    'rate': 0.05,
+    'max_missing': 10  # Cycles in a row without a temperature before the run stops
+}
+
+def signal_handler(signum, frame):
+    """Handle keyboard interrupts and system signals"""
+    print("\nSignal received. Saving data and shutting down...")
+    raise KeyboardInterrupt
+
+class Channel:
+    def __init__(self, name, temp_logger, ps, output_folder, executor, clock=time, target=20.0, kp=0.65,
+                 ki=0.01, kd=0.05, direction=-1, voltage_limit=6.0, rate=0.05, max_missing=10):
+        """One Peltier stage: its instruments, setpoint, gains, controller state and log.
+
+        Like main.py, the voltage is ramped by rate per cycle up to
+        voltage_limit until the target is first reached, then the PID
+        takes over, starting from the ramp voltage. After max_missing cycles
+        in a row without a temperature, update() raises so every output is
+        switched off.
+        """
+        self.name = name
+        self.clock = clock
+        self.temp_logger = temp_logger
+        self.ps = ps
+        self.output_folder = output_folder
+        self.target = target
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.direction = direction
+        self.voltage_limit = voltage_limit
+        self.rate = rate
+        self.max_missing = max_missing
+        self.missing = 0
+
+        self.voltage = 0.0
+        self.pid = PID(kp, ki, kd, direction)
+        self.readings = 0
+        self.target_reached = False
+        self.temperature = None
+
+        os.makedirs(output_folder, exist_ok=True)
+        self.io = ConcurrentIO(temp_logger, ps, clock, executor)
+        self.log_file = os.path.join(output_folder, 'power_supply_temp_log.csv')
+        self.log_writer = StreamingLogWriter(self.log_file)
+        self.data = MeasurementStore()
+
+    def update(self, snapshot):
+        """Run the controller on a snapshot, log it and return the new voltage"""
+        temperature = snapshot['Temperature']
+        self.missing = self.missing + 1 if temperature is None else 0
+        if self.missing >= self.max_missing:
+            raise RuntimeError(f"[{self.name}] No temperature reading for {self.missing} cycles, switching the outputs off")
+        if not self.target_reached:
+            self.voltage = min(self.voltage + self.rate, self.voltage_limit)
+        elif temperature is not None:
+            self.voltage = self.pid.update(self.target, temperature, self.clock.monotonic())
+
+        self.log_writer.write(snapshot['Timestamp'], self.voltage, snapshot['Measured_Voltage'],
+                              snapshot['Measured_Current'], temperature)
+        self.data.append(snapshot['Timestamp'], self.voltage, snapshot['Measured_Voltage'],
+                         snapshot['Measured_Current'], temperature)
+
+        self.readings += 1
+        self.temperature = temperature
+        if self.readings > 3 and temperature is not None and not self.target_reached:
+            if abs(temperature - self.target) <= 0.1:
+                print(f"[{self.name}] Target temperature {self.target}°C reached! Switching to PID control.")
+                self.target_reached = True
+                self.pid.reset(self.voltage, self.target, temperature, self.clock.monotonic())
+        return self.voltage
+
+    def finish(self, error=False, duration=None):
+        """Close the log, write the run archive and start the Excel and plot export"""
+        self.log_writer.close()
+        if not len(self.data):
+            return
+        try:
+            write_archive(os.path.join(self.output_folder, ARCHIVE_FILE), self.data.columns, {
+                'target_temperature': self.target, 'kp': self.kp, 'ki': self.ki, 'kd': self.kd,
+                'voltage_limit': self.voltage_limit, 'rate': self.rate, 'duration': duration
+            })
+        except Exception as e:
+            print(f"[{self.name}] Error writing run archive: {e}")
+        start_export(self.output_folder, error=error)
+
+    def shutdown(self):
+        """Switch the output off and release the instruments.
+
+        The shared executor must be drained first, so no apply() is left to
+        switch the output back on.
+        """
+        close_instruments(self.temp_logger, self.ps)
+        self.io.close()
+
+def open_instruments(config, rm):
+    """Open the sensor and power supply of one channel"""
+    # Read on its own thread, so the loop never gets a stale or missing polled reading
+    temp_logger = BackgroundTempReader(PT100TempLogger(config['sensor']))
+    try:
+        ps = PowerSupply(rm.open_resource(config['supply']), opener=lambda: rm.open_resource(config['supply']))
+        ps.reset()
+    except Exception:
+        close_instruments(temp_logger, None)
+        raise
+    return temp_logger, ps
+
+def close_instruments(temp_logger, ps):
+    """Switch the supply off and release both instruments of a channel"""
+    if ps:
+        try:
+            ps.write('OUTP OFF')
+            ps.close()
+        except Exception:
+            pass
+    if isinstance(temp_logger, BackgroundTempReader):
+        temp_logger.stop()
+        try:
+            temp_logger.source.ser.close()
+        except Exception:
+            pass
+
+def run(config_file, simulate=False):
+    """Control every channel in config_file from one loop"""
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    with open(config_file) as f:
+        config = json.load(f)
+    period = config.get('period', 1.0)
+    duration = config.get('duration', 120)
+    policy = config.get('policy', 'skip')
+    simulate = simulate or config.get('simulate', False)
+    channel_configs = config['channels']
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    prefix = 'simulation' if simulate else 'measurements'
+    # Two threads per channel: sensor read and supply traffic overlap across all stages
+    executor = ThreadPoolExecutor(max_workers=2 * len(channel_configs), thread_name_prefix='io')
+    channels = []
+    opening = []
+    rm = None
+    clock = time
+    scheduler = None
+    telemetry = None
+    error = False
+
+    try:
+        if simulate:
+            plants = [PeltierPlant() for _ in channel_configs]
+            clock = SimClock(*plants)
+            instruments = [(SimTempLogger(plant, clock), PowerSupply(SimPowerSupply(plant, clock))) for plant in plants]
+            print(f"Running {len(plants)} channels against the simulated Peltier stage")
+        else:
+            import pyvisa
+            rm = pyvisa.ResourceManager()
+            # Opening in parallel waits for the Arduino READY handshakes once, not once per channel.
+            # If one channel fails, finally closes the ones that did open.
+            opening = [executor.submit(open_instruments, c, rm) for c in channel_configs]
+            instruments = [future.result() for future in opening]
+
+        for i, (channel_config, (temp_logger, ps)) in enumerate(zip(channel_configs, instruments)):
+            name = channel_config.get('name', f'ch{i + 1}')
+            settings = {key: channel_config.get(key, value) for key, value in CHANNEL_DEFAULTS.items()}
+            channels.append(Channel(name, temp_logger, ps, f'{prefix}_{timestamp}_{name}', executor, clock,
+                                    **settings))
+
+        telemetry = Telemetry(port=config.get('telemetry_port', 8765), console_interval=config.get('console_interval', 10.0))
+        scheduler = LoopScheduler(period, policy, clock)
+        elapsed_time = 0
+        while elapsed_time < duration:
+            pending = [channel.io.start_acquire() for channel in channels]
+            snapshots = [channel.io.finish_acquire(p) for channel, p in zip(channels, pending)]
+            voltages = [channel.update(snapshot) for channel, snapshot in zip(channels, snapshots)]
+            wait([executor.submit(channel.io.apply, voltage) for channel, voltage in zip(channels, voltages)])
+
+            for channel, snapshot in zip(channels, snapshots):
+                telemetry.publish({
+                    'timestamp': snapshot['Timestamp'],
+                    'elapsed': elapsed_time,
+                    'target': channel.target,
+                    'temperature': snapshot['Temperature'],
+                    'set_voltage': channel.voltage,
+                    'measured_voltage': snapshot['Measured_Voltage'],
+                    'measured_current': snapshot['Measured_Current'],
+                    'pid_active': channel.target_reached,
+                    'cycles': channel.readings
+                }, channel.name)
+
+            scheduler.wait()
+            elapsed_time = scheduler.elapsed()
+
+        print("\nMeasurement complete!")
+
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user.")
+        error = True
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        error = True
+
+    finally:
+        # Let any apply() still running finish, then switch every output off
+        executor.shutdown(wait=True, cancel_futures=True)
+        for channel in channels:
+            channel.shutdown()
+        owned = {id(channel.ps) for channel in channels}
+        for future in opening:
+            if not future.cancelled() and future.exception() is None and id(future.result()[1]) not in owned:
+                close_instruments(*future.result())
+        if telemetry:
+            telemetry.close()
+        if rm:
+            try:
+                rm.close()
+            except Exception:
+                pass
+
+        if scheduler:
+            stats = scheduler.summary()
+            print(f"Loop timing: {stats['cycles']} cycles for {len(channels)} channels, "
+                  f"{stats['overruns']} overruns, max jitter {stats['max_jitter'] * 1000:.1f}ms")
+        for channel in channels:
+            channel.finish(error=error, duration=duration)
+        if channels:
+            print("Writing Excel files and plots in the background")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Control several Peltier stages from one process')
+    parser.add_argument('config', help='JSON file with period, duration and a list of channels')
+    parser.add_argument('--simulate', action='store_true', help='run every channel against the simulator')
+    args = parser.parse_args(argv)
+    run(args.config, args.simulate)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,310 @@
 import serial
 import time
-import pandas as pd
-import matplotlib.pyplot as plt
+import math
+import struct
+import bisect
+import binascii
+from collections import deque
+import threading
+from array import array
 import os
-from datetime import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
 
-class PT100TempLogger:
-    def __init__(self, port, baudrate=9600):
-        """Initialize the serial connection with Arduino"""
+class LoopScheduler:
+    def __init__(self, period=1.0, policy='skip', clock=time):
+        """Run a loop at a fixed period against a monotonic deadline.
+
+        policy='catchup' keeps every deadline, so cycles after an overrun run
+        back-to-back until the schedule is met again. policy='skip' drops the
+        deadlines that were missed and realigns to the next one on the grid.
+        clock provides monotonic() and sleep(), the time module by default.
+        """
+        if policy not in ('catchup', 'skip'):
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.period = period
+        self.policy = policy
+        self.clock = clock
+        self.start_time = clock.monotonic()
+        self.deadline = self.start_time + period
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        # Running aggregates, so memory stays constant however long the run
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    def elapsed(self):
+        """Seconds since the scheduler was started"""
+        return self.clock.monotonic() - self.start_time
+
+    def wait(self):
+        """Sleep until the next deadline; the time spent in the cycle is already subtracted"""
+        now = self.clock.monotonic()
+        remaining = self.deadline - now
+        if remaining > 0:
+            self.clock.sleep(remaining)
+            now = self.clock.monotonic()
+        else:
+            self.overruns += 1
+
+        lateness = now - self.deadline
+        self.total_jitter += lateness
+        self.max_jitter = max(self.max_jitter, lateness) if self.cycles else lateness
+        self.cycles += 1
+
+        if self.policy == 'skip' and lateness >= self.period:
+            missed = int(lateness // self.period)
+            self.skipped += missed
+            self.deadline += missed * self.period
+        self.deadline += self.period
+
+    def summary(self):
+        """Return loop timing statistics"""
+        if not self.cycles:
+            return {'cycles': 0, 'overruns': 0, 'skipped': 0, 'mean_jitter': 0.0, 'max_jitter': 0.0}
+        return {
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'mean_jitter': self.total_jitter / self.cycles,
+            'max_jitter': self.max_jitter
+        }
+
+# Binary stream frame sent by the firmware in streaming mode (see src/main.cpp)
+FRAME_SYNC = b'\xaa\x55'
+FRAME_FORMAT = struct.Struct('<2sHIHB')  # sync, sequence, micros, raw RTD, fault
+FRAME_CRC = struct.Struct('<H')
+FRAME_SIZE = FRAME_FORMAT.size + FRAME_CRC.size
+
+RTD_A = 3.9083e-3
+RTD_B = -5.775e-7
+
+def rtd_to_temperature(rtd, rnominal=100.0, rref=430.0):
+    """Convert a raw MAX31865 RTD code to °C, same maths as the Adafruit library"""
+    rt = rtd / 32768 * rref
+    z1 = -RTD_A
+    z2 = RTD_A * RTD_A - 4 * RTD_B
+    z3 = 4 * RTD_B / rnominal
+    z4 = 2 * RTD_B
+    temp = (math.sqrt(z2 + z3 * rt) + z1) / z4
+    if temp >= 0:
+        return temp
+
+    # Below 0°C fall back to the polynomial fit
+    rt = rt / rnominal * 100
+    return (-242.02 + 2.2228 * rt + 2.5859e-3 * rt ** 2 - 4.8260e-6 * rt ** 3
+            - 2.8183e-8 * rt ** 4 + 1.5243e-10 * rt ** 5)
+
+TIMER_MIN_BITS = 10  # First bucket holds everything up to 2**10 ns (~1 us)
+TIMER_BUCKETS = 26  # Doubling buckets up to 2**35 ns (~34 s), the last one is open ended
+
+class StageTimer:
+    def __init__(self):
+        """Per-stage timing histograms of the control cycle.
+
+        Durations are taken with perf_counter_ns and counted in fixed buckets
+        that double in width, so recording is a bit_length and an increment.
+        """
+        self.counts = {}
+        self.totals = {}
+        self.maxima = {}
+
+    def start(self):
+        return time.perf_counter_ns()
+
+    def stop(self, stage, start):
+        """Record the time since start for stage and return the current time"""
+        now = time.perf_counter_ns()
+        self.record(stage, now - start)
+        return now
+
+    def record(self, stage, ns):
+        counts = self.counts.get(stage)
+        if counts is None:
+            counts = self.counts[stage] = [0] * TIMER_BUCKETS
+            self.totals[stage] = 0
+            self.maxima[stage] = 0
+        counts[min(max(ns.bit_length() - TIMER_MIN_BITS, 0), TIMER_BUCKETS - 1)] += 1
+        self.totals[stage] += ns
+        if ns > self.maxima[stage]:
+            self.maxima[stage] = ns
+
+    @staticmethod
+    def bucket_limit(index):
+        """Upper bound of a bucket in ns"""
+        return 1 << (index + TIMER_MIN_BITS)
+
+    def percentile(self, stage, fraction):
+        """Upper bucket bound below which fraction of the samples of stage fall, in ns"""
+        counts = self.counts[stage]
+        target = fraction * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= target:
+                return min(self.bucket_limit(index), self.maxima[stage])
+        return self.maxima[stage]
+
+    def summary(self):
+        """count, mean, p50, p99 and max per stage, times in ms"""
+        result = {}
+        for stage, counts in self.counts.items():
+            count = sum(counts)
+            result[stage] = {
+                'count': count,
+                'mean_ms': self.totals[stage] / count / 1e6,
+                'p50_ms': self.percentile(stage, 0.5) / 1e6,
+                'p99_ms': self.percentile(stage, 0.99) / 1e6,
+                'max_ms': self.maxima[stage] / 1e6
+            }
+        return result
+
+    def write_csv(self, path):
+        """Write the histograms, one row per stage and bucket, next to the run data"""
+        with open(path, 'w', newline='') as f:
+            f.write('Stage,Bucket_Upper_us,Count\n')
+            for stage, counts in self.counts.items():
+                for index, count in enumerate(counts):
+                    if count:
+                        upper = 'inf' if index == TIMER_BUCKETS - 1 else f'{self.bucket_limit(index) / 1000:.3f}'
+                        f.write(f'{stage},{upper},{count}\n')
+        return path
+
+# A dropped USB link raises a plain OSError from ioctl (in_waiting) on Linux, not a SerialException
+SERIAL_ERRORS = (serial.SerialException, OSError)
+
+READY_TIMEOUT = 3.0  # Seconds to wait for the firmware's READY line after the board resets
+
+def wait_ready(ser, timeout=READY_TIMEOUT):
+    """Wait for the READY line the firmware prints at the end of setup(), return False on timeout"""
+    deadline = time.monotonic() + timeout
+    received = bytearray()
+    while time.monotonic() < deadline:
+        chunk = ser.read(ser.in_waiting or 1)
+        if chunk:
+            received += chunk
+            if b'READY' in received:
+                return True
+        else:
+            time.sleep(0.01)
+    return False
+
+class Backoff:
+    def __init__(self, initial=0.5, maximum=8.0, clock=time):
+        """Exponentially growing delay between reconnection attempts"""
+        self.initial = initial
+        self.maximum = maximum
+        self.clock = clock
+        self.delay = initial
+        self.next_attempt = 0.0
+
+    def ready(self):
+        """True once the current delay has passed"""
+        return self.clock.monotonic() >= self.next_attempt
+
+    def failed(self):
+        """Schedule the next attempt and double the delay"""
+        self.next_attempt = self.clock.monotonic() + self.delay
+        self.delay = min(self.delay * 2, self.maximum)
+
+    def reset(self):
+        self.delay = self.initial
+        self.next_attempt = 0.0
+
+class SerialSensor:
+    def __init__(self, port, baudrate=115200, timeout=1, locate=None, ready_timeout=READY_TIMEOUT):
+        """Serial link to the Arduino that reopens itself when it drops.
+
+        A read error closes the port; later reads return None until the port
+        has been reopened, with exponential backoff between attempts. locate,
+        if given, is called before each attempt to find the port again, in
+        case the board came back under a different name.
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.locate = locate
+        self.ready_timeout = ready_timeout
+        self.backoff = Backoff()
+        self.reconnects = 0
+        self.faults = 0
         try:
-            self.ser = serial.Serial(port=port, baudrate=baudrate, timeout=1)
-            time.sleep(2)
-        except serial.SerialException as e:
+            self._open()
+        except SERIAL_ERRORS as e:
             print(f"Error opening serial port: {e}")
             raise
 
-    def read_temperature(self):
-        """Read temperature data from Arduino"""
+    def _open(self):
+        self.ser = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=self.timeout)
+        # Opening the port resets the board; wait for setup() instead of a fixed delay
+        if not wait_ready(self.ser, self.ready_timeout):
+            print(f"No READY from {self.port} after {self.ready_timeout}s, continuing")
+        self._started()
+
+    def _started(self):
+        """Called once the port is open and the firmware is running"""
+
+    @property
+    def connected(self):
+        return self.ser.is_open
+
+    def _disconnect(self, error):
+        print(f"Error reading from serial port: {error}")
+        try:
+            self.ser.close()
+        except SERIAL_ERRORS:
+            pass
+        self.backoff.failed()
+
+    def _reconnect(self):
+        """Try to reopen the port if the backoff allows it, return True once connected"""
+        if not self.backoff.ready():
+            return False
+        try:
+            if self.locate:
+                self.port = self.locate() or self.port
+            self._open()
+        except SERIAL_ERRORS as e:
+            print(f"Reconnecting to {self.port} failed, next attempt in {self.backoff.delay:.1f}s: {e}")
+            self.backoff.failed()
+            return False
+        self.backoff.reset()
+        self.reconnects += 1
+        print(f"Reconnected to {self.port}")
+        return True
+
+class PT100TempLogger(SerialSensor):
+    def __init__(self, port, baudrate=115200, locate=None):
+        """Initialize the serial connection with Arduino"""
+        super().__init__(port, baudrate, timeout=1, locate=locate)
+
+    def read_temperature(self, blocking=False):
+        """Read temperature data from Arduino
+
+        With blocking=True wait for the reply, up to the port timeout, instead
+        of giving up when nothing has arrived right after the request.
+        """
+        if not self.connected and not self._reconnect():
+            return None
         try:
             self.ser.write(b'r')
-            if self.ser.in_waiting:
-                line = self.ser.readline().decode('utf-8').strip()
+            if blocking or self.ser.in_waiting:
+                raw = self.ser.readline()
                 try:
+                    line = raw.decode('utf-8').strip()
+                    if not line:
+                        return None
+                    if line == 'Fault detected!':
+                        # Counted, not printed: the firmware has already cleared the fault
+                        self.faults += 1
+                        return None
                     return float(line)
-                except ValueError:
-                    print(f"Invalid data received: {line}")
+                except (ValueError, UnicodeDecodeError):
+                    print(f"Invalid data received: {raw!r}")
                     return None
-        except serial.SerialException as e:
-            print(f"Error reading from serial port: {e}")
+        except SERIAL_ERRORS as e:
+            self._disconnect(e)
             return None
 
     def __del__(self):
@@ -35,34 +312,635 @@ class PT100TempLogger:
         if hasattr(self, 'ser') and self.ser.is_open:
             self.ser.close()
 
-def create_plots(df, output_folder):
-    """Create and save plots from the measurement data"""
+class PowerSupply:
+    def __init__(self, resource, combined_query=True, opener=None, retries=4):
+        """SCPI power supply driver that skips commands which would not change anything.
+
+        The last commanded voltage and output state are cached, so an
+        unchanged VOLT or a repeated OUTP ON is not sent. Voltage and current
+        are read in a single MEAS:VOLT?;:MEAS:CURR? round trip; if the
+        instrument does not answer that with two values, it falls back to two
+        queries for the rest of the run.
+
+        If opener is given, a failed command reopens the resource with it, up
+        to retries times with exponential backoff, restores the remote mode,
+        voltage and output state, and is then sent again.
+        """
+        self.resource = resource
+        self.combined_query = combined_query
+        self.opener = opener
+        self.retries = retries
+        self.volt_command = None
+        self.output = None
+        self.transactions = 0
+        self.reconnects = 0
+        self.probed = False
+
+    def _send(self, method, command):
+        self.transactions += 1
+        try:
+            return getattr(self.resource, method)(command)
+        except Exception as e:
+            if self.opener is None:
+                raise
+            print(f"Power supply error on {command}: {e}")
+        self._reconnect()
+        return getattr(self.resource, method)(command)
+
+    def _reconnect(self):
+        backoff = Backoff()
+        for attempt in range(self.retries):
+            backoff.failed()
+            time.sleep(backoff.next_attempt - time.monotonic())
+            try:
+                try:
+                    self.resource.close()
+                except Exception:
+                    pass
+                self.resource = self.opener()
+                self.resource.write('SYST:REM')
+                if self.volt_command is not None:
+                    self.resource.write(self.volt_command)
+                if self.output is not None:
+                    self.resource.write('OUTP ON' if self.output else 'OUTP OFF')
+            except Exception as e:
+                print(f"Reconnecting to the power supply failed ({attempt + 1}/{self.retries}): {e}")
+                continue
+            self.reconnects += 1
+            print("Reconnected to the power supply")
+            return
+        raise ConnectionError(f"Power supply lost after {self.retries} reconnection attempts")
+
+    def write(self, command):
+        """Send a raw command; the cached state is forgotten"""
+        self.volt_command = None
+        self.output = None
+        self._send('write', command)
+
+    def query(self, command):
+        return self._send('query', command)
+
+    def reset(self):
+        """Reset the instrument and put it in remote mode"""
+        self.write('*RST')
+        self.write('SYST:REM')
+
+    def set_voltage(self, voltage):
+        command = f'VOLT {voltage:.3f}'
+        if command != self.volt_command:
+            self._send('write', command)
+            self.volt_command = command
+
+    def set_output(self, on):
+        if on != self.output:
+            self._send('write', 'OUTP ON' if on else 'OUTP OFF')
+            self.output = on
+
+    def measure(self):
+        """Return (voltage, current) measured at the output"""
+        if self.combined_query and self.probed:
+            # Once the query has worked, a failure is a real error, reconnected or raised by _send
+            voltage, current = self.query('MEAS:VOLT?;:MEAS:CURR?').replace(',', ';').split(';')
+            return float(voltage), float(current)
+        if self.combined_query:
+            try:
+                # An unsupported query usually times out; that must not look like a lost link
+                self.transactions += 1
+                reply = self.resource.query('MEAS:VOLT?;:MEAS:CURR?')
+                values = reply.replace(',', ';').split(';')
+                if len(values) == 2:
+                    measured = float(values[0]), float(values[1])
+                    self.probed = True
+                    return measured
+                print(f"Unexpected reply to combined measurement query: {reply.strip()}")
+            except ConnectionError:
+                raise
+            except Exception as e:
+                print(f"Combined measurement query not supported: {e}")
+            print("Falling back to separate MEAS:VOLT? and MEAS:CURR? queries")
+            self.combined_query = False
+        return float(self.query('MEAS:VOLT?')), float(self.query('MEAS:CURR?'))
+
+    def close(self):
+        self.resource.close()
+
+class ConcurrentIO:
+    def __init__(self, temp_logger, ps, clock=time, executor=None, timer=None):
+        """Run the Arduino and PowerSupply traffic of a cycle on two threads.
+
+        The two devices sit on independent serial links, so the temperature
+        read and the measurement queries overlap instead of adding up. Several
+        instances can share one executor, which is then not shut down by close().
+        With a StageTimer, the 'sensor' and 'measure' legs are timed separately.
+        """
+        self.temp_logger = temp_logger
+        self.ps = ps
+        self.clock = clock
+        self.timer = timer
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix='io')
+
+    def _read(self):
+        if self.timer is None:
+            return self.temp_logger.read_temperature()
+        start = self.timer.start()
+        temperature = self.temp_logger.read_temperature()
+        self.timer.stop('sensor', start)
+        return temperature
+
+    def _measure(self):
+        start = self.timer.start() if self.timer else None
+        actual_voltage, actual_current = self.ps.measure()
+        if self.timer:
+            self.timer.stop('measure', start)
+        return actual_voltage, actual_current
+
+    def start_acquire(self):
+        """Submit the sensor read and the supply queries without waiting for them"""
+        return (self.clock.monotonic(),
+                self.executor.submit(self._read),
+                self.executor.submit(self._measure))
+
+    def finish_acquire(self, pending):
+        """Wait for a start_acquire() and return its snapshot"""
+        start, temp_future, meas_future = pending
+        temperature = temp_future.result()
+        actual_voltage, actual_current = meas_future.result()
+        return {
+            'Timestamp': self.clock.time(),
+            'Acquire_Time': self.clock.monotonic() - start,
+            'Measured_Voltage': actual_voltage,
+            'Measured_Current': actual_current,
+            'Temperature': temperature
+        }
+
+    def acquire(self):
+        """Read the sensor and the supply at the same time and return one snapshot"""
+        return self.finish_acquire(self.start_acquire())
+
+    def apply(self, voltage):
+        """Send the new setpoint to the power supply"""
+        self.ps.set_voltage(voltage)
+        self.ps.set_output(True)
+
+    def close(self):
+        """Stop the I/O worker threads"""
+        if self.own_executor:
+            self.executor.shutdown(wait=True)
+
+class PT100StreamReader(SerialSensor):
+    def __init__(self, port, baudrate=115200, period_ms=100, rnominal=100.0, rref=430.0, locate=None):
+        """Open the serial connection and start the firmware's binary stream"""
+        self.period_ms = period_ms
+        self.rnominal = rnominal
+        self.rref = rref
+        self.buffer = bytearray()
+        self.last_sequence = None
+        self.frames = 0
+        self.dropped = 0
+        self.crc_errors = 0
+        super().__init__(port, baudrate, timeout=0, locate=locate)
+
+    def _started(self):
+        # The sequence restarts with the stream, so a reconnect is not counted as dropped frames
+        self.buffer.clear()
+        self.last_sequence = None
+        self.ser.reset_input_buffer()
+        self.ser.write(f's{self.period_ms}\n'.encode())
+
+    def poll(self):
+        """Parse every complete frame received so far into (sequence, micros, temperature) tuples"""
+        if not self.connected and not self._reconnect():
+            return []
+        try:
+            waiting = self.ser.in_waiting
+            if waiting:
+                self.buffer += self.ser.read(waiting)
+        except SERIAL_ERRORS as e:
+            self._disconnect(e)
+            return []
+
+        samples = []
+        pos = 0
+        end = len(self.buffer)
+        with memoryview(self.buffer) as view:
+            while end - pos >= FRAME_SIZE:
+                if view[pos] != FRAME_SYNC[0] or view[pos + 1] != FRAME_SYNC[1]:
+                    # Resynchronise, keeping a trailing first sync byte for the next poll
+                    pos = self.buffer.find(FRAME_SYNC, pos + 1)
+                    if pos < 0:
+                        pos = end - 1
+                    continue
+
+                crc, = FRAME_CRC.unpack_from(view, pos + FRAME_FORMAT.size)
+                if binascii.crc_hqx(view[pos:pos + FRAME_FORMAT.size], 0xFFFF) != crc:
+                    self.crc_errors += 1
+                    pos += 1
+                    continue
+
+                _, sequence, micros, rtd, fault = FRAME_FORMAT.unpack_from(view, pos)
+                if self.last_sequence is not None:
+                    self.dropped += (sequence - self.last_sequence - 1) & 0xFFFF
+                self.last_sequence = sequence
+                self.frames += 1
+
+                if fault:
+                    self.faults += 1
+                temperature = None if fault else rtd_to_temperature(rtd, self.rnominal, self.rref)
+                samples.append((sequence, micros, temperature))
+                pos += FRAME_SIZE
+        del self.buffer[:pos]
+        return samples
+
+    def read_temperature(self):
+        """Return the newest streamed temperature, or None if no new frame has arrived"""
+        samples = self.poll()
+        return samples[-1][2] if samples else None
+
+    def __del__(self):
+        """Cleanup: Stop the stream and close serial connection"""
+        if hasattr(self, 'ser') and self.ser.is_open:
+            try:
+                self.ser.write(b'x')
+            except SERIAL_ERRORS:
+                pass
+            self.ser.close()
+
+class RingBuffer:
+    def __init__(self, size=1024):
+        """Fixed-size buffer of preallocated timestamps and values"""
+        self.size = size
+        self.times = array('d', bytes(8 * size))
+        self.values = array('d', bytes(8 * size))
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def push(self, timestamp, value):
+        """Store a sample, overwriting the oldest one when full"""
+        with self.lock:
+            index = self.count % self.size
+            self.times[index] = timestamp
+            self.values[index] = value
+            self.count += 1
+
+    def latest(self):
+        """Return the newest (timestamp, value), or None if empty"""
+        with self.lock:
+            if not self.count:
+                return None
+            index = (self.count - 1) % self.size
+            return self.times[index], self.values[index]
+
+    def last(self, n):
+        """Return the newest n samples as (timestamps, values), oldest first"""
+        with self.lock:
+            n = min(n, self.count, self.size)
+            start = (self.count - n) % self.size
+            end = start + n
+            if end <= self.size:
+                return self.times[start:end], self.values[start:end]
+            end -= self.size
+            return self.times[start:] + self.times[:end], self.values[start:] + self.values[:end]
+
+class BackgroundTempReader:
+    def __init__(self, source, size=1024, max_age=5.0, period=0.1):
+        """Acquire temperatures from a PT100TempLogger or PT100StreamReader on a background thread.
+
+        The control loop reads the ring buffer and never touches the port.
+        A PT100TempLogger is polled every period seconds, so the default ring
+        holds the last ~100 s; a PT100StreamReader is paced by its stream.
+        Readings older than max_age seconds are reported as None. Errors in
+        the thread are counted and retried with backoff; if the thread dies
+        anyway, read_temperature() raises instead of returning None forever.
+        """
+        self.source = source
+        self.buffer = RingBuffer(size)
+        self.max_age = max_age
+        self.period = period
+        self.errors = 0
+        self.backoff = Backoff(initial=period)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='temp-reader', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self._acquire()
+            except Exception as e:
+                # Keep acquiring; one bad read must not leave the loop without a sensor
+                self.errors += 1
+                print(f"Temperature reader error #{self.errors}: {e!r}")
+                self.backoff.failed()
+                self.stop_event.wait(self.backoff.next_attempt - time.monotonic())
+                continue
+            self.backoff.reset()
+            if not isinstance(self.source, PT100StreamReader):
+                self.stop_event.wait(max(self.period - (time.monotonic() - start), 0.0))
+
+    def _acquire(self):
+        if not self.source.connected and not self.source.backoff.ready():
+            self.stop_event.wait(0.1)
+        elif isinstance(self.source, PT100StreamReader):
+            for _, _, temperature in self.source.poll():
+                if temperature is not None:
+                    self.buffer.push(time.monotonic(), temperature)
+            self.stop_event.wait(0.005)
+        else:
+            temperature = self.source.read_temperature(blocking=True)
+            if temperature is not None:
+                self.buffer.push(time.monotonic(), temperature)
+
+    def latest(self):
+        """Return the newest (monotonic timestamp, temperature), or None"""
+        return self.buffer.latest()
+
+    def last(self, n):
+        """Return the newest n (timestamps, temperatures), oldest first"""
+        return self.buffer.last(n)
+
+    def read_temperature(self):
+        """Return the newest temperature, or None if there is none younger than max_age"""
+        if not self.thread.is_alive() and not self.stop_event.is_set():
+            raise RuntimeError("Temperature reader thread has stopped")
+        sample = self.buffer.latest()
+        if sample is None or time.monotonic() - sample[0] > self.max_age:
+            return None
+        return sample[1]
+
+    def stop(self):
+        """Stop the acquisition thread"""
+        self.stop_event.set()
+        self.thread.join(timeout=2)
+
+class SignalConditioner:
+    def __init__(self, source, method='median', window=3, time_constant=2.0, process_noise=1e-4,
+                 measurement_noise=5e-4, max_step=1.0, confirm=3, hold=5.0, valid_range=(-50.0, 150.0),
+                 clock=time):
+        """Reject faults and spikes in the readings of source and filter the rest.
+
+        A reading outside valid_range, or more than max_step °C away from the
+        last accepted one, is rejected, unless confirm such readings arrive in
+        a row within max_step of each other, which is taken as a real jump. While readings are missing or
+        rejected, the last filtered value is returned for up to hold seconds,
+        then None. method is None, 'median' (of the last window readings),
+        'ema' (time_constant seconds) or 'kalman' (random walk, process_noise
+        in °C²/s, measurement_noise in °C²). Every step is O(window) at most.
+        """
+        if method not in (None, 'median', 'ema', 'kalman'):
+            raise ValueError(f"Unknown filter: {method}")
+        self.source = source
+        self.method = method
+        self.window = deque(maxlen=window)
+        self.ordered = []
+        self.time_constant = time_constant
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_step = max_step
+        self.confirm = confirm
+        self.hold = hold
+        self.valid_range = valid_range
+        self.clock = clock
+        self.last_raw = None
+        self.suspect = 0
+        self.candidate = None  # Level of the current run of out-of-step readings
+        self.value = None
+        self.variance = measurement_noise
+        self.last_time = None
+        self.rejected = 0
+        self.held = 0
+
+    def read_temperature(self):
+        return self.update(self.source.read_temperature(), self.clock.monotonic())
+
+    def update(self, raw, now):
+        """Feed one reading (or None) taken at now, return the conditioned temperature or None"""
+        if raw is not None and not self.valid_range[0] <= raw <= self.valid_range[1]:
+            raw = None
+            self.rejected += 1
+        if raw is not None and self.last_raw is not None and abs(raw - self.last_raw) > self.max_step:
+            # Only readings that agree with each other make a jump; scattered spikes start over
+            if self.candidate is not None and abs(raw - self.candidate) <= self.max_step:
+                self.suspect += 1
+            else:
+                self.candidate = raw
+                self.suspect = 1
+            if self.suspect < self.confirm:
+                raw = None
+                self.rejected += 1
+            else:
+                # A persistent jump is real, start the filter again from it
+                self.window.clear()
+                self.ordered.clear()
+                self.value = None
+        if raw is None:
+            if self.value is not None and now - self.last_time <= self.hold:
+                self.held += 1
+                return self.value
+            return None
+
+        self.suspect = 0
+        self.candidate = None
+        self.last_raw = raw
+        dt = now - self.last_time if self.value is not None else 0.0
+        self.last_time = now
+        if self.value is None or self.method is None:
+            self.value = raw
+            self.variance = self.measurement_noise
+        if self.method == 'median':
+            if len(self.window) == self.window.maxlen:
+                self.ordered.remove(self.window[0])
+            self.window.append(raw)
+            bisect.insort(self.ordered, raw)
+            self.value = self.ordered[len(self.ordered) // 2]
+        elif self.method == 'ema':
+            self.value += (1 - math.exp(-dt / self.time_constant)) * (raw - self.value)
+        elif self.method == 'kalman':
+            self.variance += self.process_noise * dt
+            gain = self.variance / (self.variance + self.measurement_noise)
+            self.value += gain * (raw - self.value)
+            self.variance *= 1 - gain
+        return self.value
+
+LOG_COLUMNS = ['Timestamp', 'Set_Voltage', 'Measured_Voltage', 'Measured_Current', 'Temperature']
+LOG_RECORD = '%17.6f,%8.3f,%8.3f,%8.3f,%8.3f\n'  # Fixed width, Timestamp in epoch seconds
+
+class StreamingLogWriter:
+    def __init__(self, path, buffer_size=10, fsync_interval=None):
+        """Append fixed-width CSV records to path while the run is in progress.
+
+        At most buffer_size records are held in memory before they are written
+        out. If fsync_interval is set, the file is also forced to disk at most
+        that many seconds apart, so a hard crash loses little data.
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.buffer = []
+        self.last_sync = time.monotonic()
+        self.file = open(path, 'a', newline='')
+        if self.file.tell() == 0:
+            self.file.write(','.join(LOG_COLUMNS) + '\n')
+
+    def write(self, timestamp, set_voltage, measured_voltage, measured_current, temperature):
+        """Queue one record and flush once the buffer is full"""
+        if temperature is None:
+            temperature = math.nan
+        self.buffer.append(LOG_RECORD % (timestamp, set_voltage, measured_voltage, measured_current, temperature))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        """Write buffered records to the file, and to disk if due"""
+        if self.buffer:
+            self.file.write(''.join(self.buffer))
+            self.buffer.clear()
+        self.file.flush()
+        now = time.monotonic()
+        if sync or (self.fsync_interval is not None and now - self.last_sync >= self.fsync_interval):
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+
+    def close(self):
+        """Flush everything to disk and close the file"""
+        if not self.file.closed:
+            self.flush(sync=True)
+            self.file.close()
+
+class MeasurementStore:
+    def __init__(self):
+        """Columnar in-memory store of measurements, one array('d') per column.
+
+        Timestamps are epoch seconds, missing temperatures are NaN. Each sample
+        takes 40 bytes instead of a dict with a datetime and four floats.
+        """
+        self.columns = {name: array('d') for name in LOG_COLUMNS}
+
+    def append(self, timestamp, set_voltage, measured_voltage, measured_current, temperature):
+        """Add one sample"""
+        if temperature is None:
+            temperature = math.nan
+        columns = self.columns
+        columns['Timestamp'].append(timestamp)
+        columns['Set_Voltage'].append(set_voltage)
+        columns['Measured_Voltage'].append(measured_voltage)
+        columns['Measured_Current'].append(measured_current)
+        columns['Temperature'].append(temperature)
+
+    def __len__(self):
+        return len(self.columns['Timestamp'])
+
+    def to_dataframe(self):
+        """Wrap the columns in a DataFrame without converting row by row.
+
+        The float columns are NumPy views on the arrays, so stop appending
+        before calling this.
+        """
+        import numpy as np
+        import pandas as pd
+        df = pd.DataFrame({name: np.frombuffer(column, dtype=np.float64)
+                           for name, column in self.columns.items()}, copy=False)
+        df['Timestamp'] = epoch_to_local(df['Timestamp'])
+        return df
+
+def epoch_to_local(seconds):
+    """Convert epoch seconds to naive local-time datetimes, as datetime.now() gives"""
+    import pandas as pd
+    from dateutil.tz import tzlocal
+    # The local zone, not today's UTC offset, so runs on the other side of a DST change come out right
+    return pd.to_datetime(seconds, unit='s', utc=True).dt.tz_convert(tzlocal()).dt.tz_localize(None)
+
+def local_to_epoch(timestamps):
+    """Convert naive local-time datetimes, as written to the Excel logs, to epoch seconds"""
+    import pandas as pd
+    from dateutil.tz import gettz
+    # pandas would take naive values as UTC. gettz() gives the zone file, whose
+    # transitions let the repeated hour at the end of DST be inferred from the order
+    local = pd.Series(pd.to_datetime(timestamps))
+    try:
+        local = local.dt.tz_localize(gettz(), ambiguous='infer', nonexistent='shift_forward')
+    except Exception:
+        local = local.dt.tz_localize(gettz(), ambiguous=True, nonexistent='shift_forward')
+    return ((local - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy()
+
+def load_log(log_file):
+    """Load a streamed CSV log into a DataFrame with local-time timestamps"""
+    import pandas as pd
+    df = pd.read_csv(log_file, skipinitialspace=True)
+    df['Timestamp'] = epoch_to_local(df['Timestamp'])
+    return df
+
+MAX_PLOT_POINTS = 5000
+
+def decimate_minmax(columns, max_points):
+    """Indices of at most about max_points samples that keep the extremes of every column.
+
+    The samples are split into buckets of consecutive points and, for each
+    column, the minimum and maximum of each bucket are kept, so peaks and
+    transients survive. NaN never counts as an extreme.
+    """
+    import numpy as np
+    n = len(columns[0])
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, max_points // (2 * len(columns)))
+    size = -(-n // buckets)
+    pad = np.full(buckets * size - n, np.nan)
+    base = np.arange(buckets) * size
+    keep = [np.array([0, n - 1])]
+    for values in columns:
+        grid = np.concatenate([np.asarray(values, dtype=float), pad]).reshape(buckets, size)
+        missing = np.isnan(grid)
+        keep.append(base + np.argmin(np.where(missing, np.inf, grid), axis=1))
+        keep.append(base + np.argmax(np.where(missing, -np.inf, grid), axis=1))
+    index = np.unique(np.concatenate(keep))
+    return index[index < n]
+
+def create_plots(df, output_folder, dpi=300, max_points=MAX_PLOT_POINTS):
+    """Create and save plots from the measurement data
+
+    Each series is reduced to about max_points points with decimate_minmax,
+    so plotting time does not grow with the run length. None plots every sample.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    def lod(x, y):
+        x = x.to_numpy()
+        y = y.to_numpy()
+        if not max_points:
+            return x, y
+        index = decimate_minmax([x, y], max_points)
+        return x[index], y[index]
+
     df['Seconds'] = (df['Timestamp'] - df['Timestamp'].iloc[0]).dt.total_seconds()
     plt.figure(figsize=(15, 10))
 
     plt.subplot(2, 2, 1)
-    plt.plot(df['Seconds'], df['Temperature'], 'b-')
+    plt.plot(*lod(df['Seconds'], df['Temperature']), 'b-')
     plt.xlabel('Time (seconds)')
     plt.ylabel('Temperature (°C)')
     plt.title('Temperature vs Time')
     plt.grid(True)
 
     plt.subplot(2, 2, 2)
-    plt.plot(df['Set_Voltage'], df['Temperature'], 'r-')
+    plt.plot(*lod(df['Set_Voltage'], df['Temperature']), 'r-')
     plt.xlabel('Set Voltage (V)')
     plt.ylabel('Temperature (°C)')
     plt.title('Temperature vs Set Voltage')
     plt.grid(True)
 
     plt.subplot(2, 2, 3)
-    plt.plot(df['Measured_Voltage'], df['Temperature'], 'g-')
+    plt.plot(*lod(df['Measured_Voltage'], df['Temperature']), 'g-')
     plt.xlabel('Measured Voltage (V)')
     plt.ylabel('Temperature (°C)')
     plt.title('Temperature vs Measured Voltage')
     plt.grid(True)
 
     plt.subplot(2, 2, 4)
-    plt.plot(df['Measured_Current'], df['Temperature'], 'm-')
+    plt.plot(*lod(df['Measured_Current'], df['Temperature']), 'm-')
     plt.xlabel('Current (A)')
     plt.ylabel('Temperature (°C)')
     plt.title('Temperature vs Current')
@@ -70,25 +948,334 @@ def create_plots(df, output_folder):
 
     plt.tight_layout()
     plot_file = os.path.join(output_folder, 'measurement_plots.png')
-    plt.savefig(plot_file, dpi=300, bbox_inches='tight')
+    plt.savefig(plot_file, dpi=dpi, bbox_inches='tight')
     plt.close()
 
     return plot_file
 
-def save_data(data, output_folder, error=False):
-    """Save measurement data to Excel and create plots"""
-    if data:
-        df = pd.DataFrame(data)
+PREVIEW_DPI = 100
+PREVIEW_POINTS = 2000
+
+def save_data(data, output_folder, error=False, preview=False, dpi=None):
+    """Save measurement data to Excel and create plots
+
+    preview=True draws quick low resolution plots from fewer points.
+    """
+    import pandas as pd
+    if len(data):
+        if isinstance(data, MeasurementStore):
+            df = data.to_dataframe()
+        elif isinstance(data, pd.DataFrame):
+            df = data
+        else:
+            df = pd.DataFrame(data)
         suffix = '_ERROR' if error else ''
         excel_file = os.path.join(output_folder, f'power_supply_temp_log{suffix}.xlsx')
         df.to_excel(excel_file, index=False)
-        plot_file = create_plots(df, output_folder)
+        if preview:
+            plot_file = create_plots(df, output_folder, dpi or PREVIEW_DPI, PREVIEW_POINTS)
+        else:
+            plot_file = create_plots(df, output_folder, dpi or 300)
         return excel_file, plot_file
     return None, None
 
-def pid_control(target_temp, current_temp, Kp, Ki, Kd, integral, prev_error):
-    """Calculate the voltage adjustment using PID control."""
-    error = target_temp - current_temp
+def load_gains(path, rank=0):
+    """Return the (Kp, Ki, Kd, period) entry at rank from a gains file written by autotune.py"""
+    with open(path) as f:
+        ranked = json.load(f)
+    entry = ranked['gains'][rank]
+    return entry['kp'], entry['ki'], entry['kd'], ranked['period']
+
+class PID:
+    __slots__ = ('kp', 'ki', 'kd', 'direction', 'output_min', 'output_max', 'setpoint_weight', 'filter_time',
+                 'tracking_time', 'integral', 'error', 'derivative', 'prev_measurement', 'last_time', 'output')
+
+    def __init__(self, kp, ki, kd, direction=1, output_min=0.0, output_max=12.0, setpoint_weight=1.0,
+                 filter_time=1.0, tracking_time=None):
+        """PID controller that keeps its own state between updates.
+
+        Gains are per second: the integral and derivative are scaled by the
+        measured time between updates, so at a 1 s period they mean the same
+        as in pid_control. The derivative acts on the measurement, so a
+        setpoint change does not kick the output, and is low-pass filtered
+        with a filter_time seconds time constant. setpoint_weight scales the
+        setpoint in the proportional term. While the output is clamped, the
+        integral is pulled back towards the limit with back-calculation over
+        tracking_time seconds, by default sqrt(Ti * Td), or Ti without
+        derivative action.
+        """
+        self.direction = direction
+        self.output_min = output_min
+        self.output_max = output_max
+        self.setpoint_weight = setpoint_weight
+        self.filter_time = filter_time
+        self.kp, self.kd = kp, kd
+        self.integral = 0.0  # In volts, so set_gains() can absorb the P and D change into it
+        self.error = 0.0  # Last weighted proportional error
+        self.derivative = 0.0  # Filtered rate of change of the measurement, per second
+        self.set_gains(kp, ki, kd, tracking_time)
+        self.prev_measurement = None
+        self.last_time = None
+        self.output = 0.0
+
+    def set_gains(self, kp, ki, kd, tracking_time=None):
+        """Change the gains without a bump in the output"""
+        # The integral takes up the step the new Kp and Kd would give at the last error and rate
+        self.integral += self.direction * ((self.kp - kp) * self.error + (kd - self.kd) * self.derivative)
+        self.kp, self.ki, self.kd = kp, ki, kd
+        if tracking_time is None:
+            ti = kp / ki if ki else 0.0
+            td = kd / kp if kp else 0.0
+            tracking_time = math.sqrt(ti * td) if td else ti
+        self.tracking_time = tracking_time
+
+    def reset(self, output, setpoint, measurement, now):
+        """Take over from manual control at output without a bump"""
+        self.derivative = 0.0
+        self.prev_measurement = measurement
+        self.last_time = now
+        self.output = output
+        self.error = self.setpoint_weight * setpoint - measurement
+        self.integral = output - self.kp * self.direction * self.error
+
+    def update(self, setpoint, measurement, now):
+        """Return the output for a measurement taken at now (monotonic seconds)"""
+        dt = max(now - self.last_time, 0.0) if self.last_time is not None else 0.0
+        if dt > 0:
+            rate = (measurement - self.prev_measurement) / dt
+            self.derivative += dt / (self.filter_time + dt) * (rate - self.derivative)
+            self.integral += self.ki * self.direction * (setpoint - measurement) * dt
+
+        self.error = self.setpoint_weight * setpoint - measurement
+        unclamped = self.kp * self.direction * self.error + self.integral - self.direction * self.kd * self.derivative
+        output = min(max(unclamped, self.output_min), self.output_max)
+        if dt > 0 and self.tracking_time > 0:
+            self.integral += (output - unclamped) * min(dt / self.tracking_time, 1.0)
+
+        self.prev_measurement = measurement
+        self.last_time = now
+        self.output = output
+        return output
+
+def load_model(path):
+    """Return the (plant fit, feedforward map) stored in a gains file by autotune.py; either may be None"""
+    with open(path) as f:
+        ranked = json.load(f)
+    feedforward = ranked.get('feedforward')
+    if feedforward:
+        feedforward = FeedforwardMap(feedforward['voltage'], feedforward['delta'], feedforward['ambient'])
+    return ranked.get('plant'), feedforward
+
+def interpolate(x, xs, ys):
+    """Piecewise linear y at x through the sorted points xs, ys, held constant past the ends"""
+    i = bisect.bisect_right(xs, x)
+    if i == 0:
+        return ys[0]
+    if i == len(xs):
+        return ys[-1]
+    return ys[i - 1] + (ys[i] - ys[i - 1]) * (x - xs[i - 1]) / (xs[i] - xs[i - 1])
+
+class FeedforwardMap:
+    def __init__(self, voltages, deltas, ambient):
+        """Steady-state temperature change for each voltage, as learned by autotune.fit_feedforward"""
+        self.ambient = ambient
+        self.voltages = list(voltages)
+        self.deltas = list(deltas)
+        order = sorted(range(len(self.deltas)), key=self.deltas.__getitem__)
+        self.by_delta = ([self.deltas[i] for i in order], [self.voltages[i] for i in order])
+
+    def delta(self, voltage):
+        """Temperature change voltage settles at, relative to ambient"""
+        return interpolate(voltage, self.voltages, self.deltas)
+
+    def voltage(self, temperature):
+        """Voltage that holds temperature in steady state, limited to the learned range"""
+        return interpolate(temperature - self.ambient, *self.by_delta)
+
+class DelayedLag:
+    def __init__(self, tau, dead_time, steady):
+        """First-order lag plus dead time; steady maps an input to the value it settles at"""
+        self.tau = tau
+        self.dead_time = dead_time
+        self.steady = steady
+        self.value = 0.0  # Undelayed response
+        self.history = deque([(0.0, 0.0)])  # (time, value) pairs covering the last dead_time seconds
+        self.last_time = None
+
+    def reset(self, value, now):
+        self.value = value
+        self.history.clear()
+        self.history.append((now, value))
+        self.last_time = now
+
+    def update(self, applied, now):
+        """Advance to now with applied held since the last update, return the delayed response"""
+        if self.last_time is not None and now > self.last_time:
+            self.value += (1 - math.exp(-(now - self.last_time) / self.tau)) * (self.steady(applied) - self.value)
+        self.last_time = now
+        self.history.append((now, self.value))
+        cutoff = now - self.dead_time
+        while len(self.history) > 1 and self.history[1][0] <= cutoff:
+            self.history.popleft()
+        return self.history[0][1]
+
+class ModelController:
+    def __init__(self, pid, feedforward, plant, smith=False):
+        """PID with steady-state feedforward and optional Smith-predictor dead-time compensation.
+
+        The feedforward voltage holds the setpoint in steady state, and leads
+        setpoint changes by tau times their rate, which inverts the lag of
+        the fitted plant. The PID only corrects what the map gets wrong,
+        within the output limits left over. With smith=True, a model of the
+        plant removes the dead time from the feedback: the PID sees the
+        measurement plus the model's undelayed minus delayed response.
+        """
+        self.pid = pid
+        self.feedforward = feedforward
+        self.output_min = pid.output_min
+        self.output_max = pid.output_max
+        self.tau = plant['tau']
+        self.smith = smith
+        self.model = DelayedLag(plant['tau'], plant['dead_time'], feedforward.delta)
+        self.prev_setpoint = None
+        self.last_time = None
+        self.output = 0.0
+
+    def reset(self, output, setpoint, measurement, now):
+        """Take over from manual control at output without a bump"""
+        self.model.reset(measurement - self.feedforward.ambient, now)
+        self.pid.reset(output - self.feedforward.voltage(setpoint), setpoint, measurement, now)
+        self.prev_setpoint = setpoint
+        self.last_time = now
+        self.output = output
+
+    def update(self, setpoint, measurement, now):
+        """Return the output for a measurement taken at now (monotonic seconds)"""
+        rate = 0.0
+        if self.last_time is not None and now > self.last_time:
+            rate = (setpoint - self.prev_setpoint) / (now - self.last_time)
+        feedforward = self.feedforward.voltage(setpoint + self.tau * rate)
+
+        feedback = measurement
+        if self.smith:
+            delayed = self.model.update(self.output, now)
+            feedback += self.model.value - delayed
+
+        self.pid.output_min = self.output_min - feedforward
+        self.pid.output_max = self.output_max - feedforward
+        self.output = feedforward + self.pid.update(setpoint, feedback, now)
+        self.prev_setpoint = setpoint
+        self.last_time = now
+        return self.output
+
+    def set_gains(self, kp, ki, kd):
+        self.pid.set_gains(kp, ki, kd)
+
+def load_schedule(path):
+    """Read a gain schedule from a file, or from the 'schedule' entry of a gains file written by autotune.py"""
+    with open(path) as f:
+        spec = json.load(f)
+    # autotune.py writes "schedule": null when it was run without --schedule
+    spec = spec.get('schedule') or spec
+    if not spec.get('points'):
+        raise ValueError(f"{path} has no gain schedule points, create one with autotune.py --schedule")
+    return GainSchedule([(p['temperature'], p['kp'], p['ki'], p['kd']) for p in spec['points']],
+                        spec.get('key', 'setpoint'), spec.get('resolution', 0.1))
+
+class GainSchedule:
+    def __init__(self, points, key='setpoint', resolution=0.1):
+        """PID gains as a function of the operating temperature.
+
+        points are (temperature, kp, ki, kd) tuples; gains are interpolated
+        linearly between them and held past the ends. key says whether the
+        schedule is looked up by 'setpoint' or by measured 'temperature'.
+        The interpolation is done once on a uniform grid of resolution °C,
+        so gains() is an index computation per cycle.
+        """
+        if key not in ('setpoint', 'temperature'):
+            raise ValueError(f"Unknown schedule key: {key}")
+        points = sorted(points)
+        self.key = key
+        self.resolution = resolution
+        self.low = points[0][0]
+        temperatures = [p[0] for p in points]
+        steps = max(int(round((points[-1][0] - self.low) / resolution)), 0) + 1
+        self.table = []
+        for i in range(steps):
+            t = self.low + i * resolution
+            self.table.append(tuple(interpolate(t, temperatures, [p[k] for p in points]) for k in (1, 2, 3)))
+
+    def gains(self, temperature):
+        """(kp, ki, kd) at temperature"""
+        i = int(round((temperature - self.low) / self.resolution))
+        return self.table[min(max(i, 0), len(self.table) - 1)]
+
+def imc_gains(gain, tau, dead_time, closed_loop_time=None):
+    """IMC (lambda) PID tuning of a first-order-plus-dead-time plant, as (kp, ki, kd) in per-second units.
+
+    closed_loop_time defaults to the larger of the dead time and tau / 3.
+    """
+    if closed_loop_time is None:
+        closed_loop_time = max(dead_time, tau / 3)
+    kc = (tau + dead_time / 2) / (abs(gain) * (closed_loop_time + dead_time / 2))
+    ti = tau + dead_time / 2
+    td = tau * dead_time / (2 * tau + dead_time)
+    return kc, kc / ti, kc * td
+
+class RLSTuner:
+    def __init__(self, period, dead_time, direction=-1, forgetting=0.995, closed_loop_time=None, warmup=60):
+        """Identify the plant online by recursive least squares and retune the PID from it.
+
+        Every update fits the ARX model T[k+1] = a T[k] + b u[k-d] + c, with
+        d the dead time in samples, forgetting old samples by forgetting per
+        step. After warmup samples, a plausible estimate (a stable lag, the
+        gain with the sign direction expects) is turned into gains with
+        imc_gains.
+        """
+        self.period = period
+        self.delay = int(round(dead_time / period))
+        self.dead_time = dead_time
+        self.direction = direction
+        self.forgetting = forgetting
+        self.closed_loop_time = closed_loop_time
+        self.warmup = warmup
+        self.theta = [0.9, 0.0, 0.0]
+        self.P = [[1000.0 if i == j else 0.0 for j in range(3)] for i in range(3)]
+        self.inputs = deque(maxlen=self.delay + 1)
+        self.prev_temperature = None
+        self.samples = 0
+        self.plant = None
+
+    def update(self, temperature, voltage):
+        """Add a temperature and the voltage applied since the previous one; return new (kp, ki, kd) or None"""
+        self.inputs.append(voltage)
+        prev, self.prev_temperature = self.prev_temperature, temperature
+        if prev is None or len(self.inputs) <= self.delay:
+            return None
+        phi = (prev, self.inputs[0], 1.0)
+        P, theta, lam = self.P, self.theta, self.forgetting
+        v = [P[i][0] * phi[0] + P[i][1] * phi[1] + P[i][2] for i in range(3)]
+        gain = 1.0 / (lam + phi[0] * v[0] + phi[1] * v[1] + v[2])
+        error = temperature - (theta[0] * phi[0] + theta[1] * phi[1] + theta[2])
+        for i in range(3):
+            theta[i] += gain * v[i] * error
+            for j in range(3):
+                P[i][j] = (P[i][j] - gain * v[i] * v[j]) / lam
+        self.samples += 1
+
+        a, b = theta[0], theta[1]
+        if self.samples < self.warmup or not 0 < a < 1 or b * self.direction <= 0:
+            return None
+        self.plant = {'gain': b / (1 - a), 'tau': -self.period / math.log(a), 'dead_time': self.dead_time}
+        return imc_gains(self.plant['gain'], self.plant['tau'], self.dead_time, self.closed_loop_time)
+
+def pid_control(target_temp, current_temp, Kp, Ki, Kd, integral, prev_error, direction=1):
+    """Calculate the voltage adjustment using PID control.
+
+    direction=1 raises the voltage when the temperature is below target
+    (heating), direction=-1 when it is above target (cooling).
+    """
+    error = direction * (target_temp - current_temp)
     integral += error
     derivative = error - prev_error
     output = Kp * error + Ki * integral + Kd * derivative
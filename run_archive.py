@@ -0,0 +1,117 @@
+import os
+import sys
+import math
+import struct
+import argparse
+from pid_utils import LOG_COLUMNS, local_to_epoch
+
+# Run archive layout: a fixed 128 byte header followed by the columns in
+# LOG_COLUMNS order, each stored contiguously as little-endian float64, so a
+# column can be memory-mapped and used as a NumPy array without copying.
+ARCHIVE_MAGIC = b'PIDRUN\x00\x00'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<8sHHQ8d')
+ARCHIVE_HEADER_SIZE = 128
+ARCHIVE_PARAMS = ['start_time', 'target_temperature', 'kp', 'ki', 'kd', 'voltage_limit', 'rate', 'duration']
+ARCHIVE_FILE = 'run.pidrun'
+
+def write_archive(path, columns, params=None):
+    """Write measurement columns and run parameters to a run archive.
+
+    columns maps each name in LOG_COLUMNS to a sequence of floats with
+    epoch-second timestamps. Missing parameters are stored as NaN.
+    """
+    import numpy as np
+    params = params or {}
+    arrays = [np.asarray(columns[name], dtype='<f8') for name in LOG_COLUMNS]
+    n_rows = len(arrays[0])
+    values = [float(params.get(name, math.nan)) for name in ARCHIVE_PARAMS]
+    if math.isnan(values[0]) and n_rows:
+        values[0] = float(arrays[0][0])
+
+    header = ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(LOG_COLUMNS), n_rows, *values)
+    with open(path, 'wb') as f:
+        f.write(header.ljust(ARCHIVE_HEADER_SIZE, b'\x00'))
+        for column in arrays:
+            f.write(column.tobytes())
+    return path
+
+def read_header(path):
+    """Return (params, n_rows) from a run archive without touching the column data"""
+    with open(path, 'rb') as f:
+        raw = f.read(ARCHIVE_HEADER.size)
+    if len(raw) < ARCHIVE_HEADER.size:
+        raise ValueError(f"Truncated run archive: {path}")
+    magic, version, n_columns, n_rows, *values = ARCHIVE_HEADER.unpack(raw)
+    if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+        raise ValueError(f"Not a version {ARCHIVE_VERSION} run archive: {path}")
+    if n_columns != len(LOG_COLUMNS):
+        raise ValueError(f"Unexpected column count {n_columns} in {path}")
+    return dict(zip(ARCHIVE_PARAMS, values)), n_rows
+
+def load_archive(path):
+    """Memory-map a run archive and return (params, columns) with NumPy views per column"""
+    import numpy as np
+    params, n_rows = read_header(path)
+    if n_rows == 0:
+        return params, {name: np.empty(0) for name in LOG_COLUMNS}
+    data = np.memmap(path, dtype='<f8', mode='r', offset=ARCHIVE_HEADER_SIZE,
+                     shape=(len(LOG_COLUMNS), n_rows))
+    return params, {name: data[i] for i, name in enumerate(LOG_COLUMNS)}
+
+def convert_xlsx(xlsx_file, archive_file=None, params=None):
+    """Convert a power_supply_temp_log*.xlsx file to a run archive next to it"""
+    import pandas as pd
+    df = pd.read_excel(xlsx_file)
+    columns = {name: df[name].astype(float) for name in LOG_COLUMNS if name != 'Timestamp'}
+    # Naive timestamps were written in local time
+    columns['Timestamp'] = local_to_epoch(df['Timestamp'])
+    if archive_file is None:
+        archive_file = os.path.join(os.path.dirname(xlsx_file), ARCHIVE_FILE)
+    return write_archive(archive_file, columns, params)
+
+def find_logs(root):
+    """Yield every Excel measurement log below root"""
+    for folder, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.startswith('power_supply_temp_log') and name.endswith('.xlsx'):
+                yield os.path.join(folder, name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert and inspect run archives')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='convert Excel logs below a folder to run archives')
+    convert.add_argument('root', nargs='?', default='logs')
+    convert.add_argument('--force', action='store_true', help='overwrite existing archives')
+    for name in ARCHIVE_PARAMS[1:]:
+        convert.add_argument(f'--{name.replace("_", "-")}', type=float, dest=name,
+                             help='run parameter to record, the Excel logs do not contain it')
+
+    info = commands.add_parser('info', help='print the header of run archives')
+    info.add_argument('files', nargs='+')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        params = {name: getattr(args, name) for name in ARCHIVE_PARAMS[1:] if getattr(args, name) is not None}
+        for xlsx_file in find_logs(args.root):
+            archive_file = os.path.join(os.path.dirname(xlsx_file), ARCHIVE_FILE)
+            if os.path.exists(archive_file) and not args.force:
+                print(f"Skipping {xlsx_file}, archive exists")
+                continue
+            try:
+                convert_xlsx(xlsx_file, archive_file, params)
+                print(f"Converted {xlsx_file} -> {archive_file}")
+            except Exception as e:
+                print(f"Error converting {xlsx_file}: {e}")
+    else:
+        for path in args.files:
+            params, n_rows = read_header(path)
+            print(f"{path}: {n_rows} rows")
+            for name, value in params.items():
+                print(f"  {name}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import sys
+import json
+import bisect
+import argparse
+
+def load_profile(path):
+    """Read a profile file: {"start": optional °C, "segments": [...]}"""
+    with open(path) as f:
+        spec = json.load(f)
+    if not spec.get('segments'):
+        raise ValueError(f"{path} has no segments")
+    return spec
+
+class Profile:
+    def __init__(self, segments, start):
+        """Setpoint schedule built from a list of segments, starting at start °C.
+
+        Segments are dicts:
+            {"ramp": 20.0, "rate": 0.5}     ramp to 20 °C at 0.5 °C/min
+            {"ramp": 20.0, "time": 600}     ramp to 20 °C in 600 s
+            {"soak": 300}                   hold the setpoint for 300 s
+            {"step": 18.0}                  jump to 18 °C
+            {"loop": 3, "segments": [...]}  repeat the nested segments 3 times
+
+        The schedule is flattened once into linear pieces; setpoint() follows
+        them with a cursor, so a control loop pays O(1) per cycle.
+        """
+        self.start = start
+        self.starts = []
+        self.ends = []
+        self.values = []
+        self.slopes = []  # °C per second
+        self.final, self.duration = self._compile(segments, start, 0.0)
+        self.cursor = 0
+
+    def _compile(self, segments, value, time):
+        for index, segment in enumerate(segments):
+            if 'ramp' in segment:
+                target = float(segment['ramp'])
+                if 'time' in segment:
+                    length = float(segment['time'])
+                elif segment.get('rate'):
+                    length = abs(target - value) / float(segment['rate']) * 60
+                else:
+                    raise ValueError(f"Segment {index}: a ramp needs a rate (°C/min) or a time (s)")
+                if length > 0:
+                    self._add(time, length, value, (target - value) / length)
+                value, time = target, time + length
+            elif 'soak' in segment:
+                length = float(segment['soak'])
+                self._add(time, length, value, 0.0)
+                time += length
+            elif 'step' in segment:
+                value = float(segment['step'])
+            elif 'loop' in segment:
+                for _ in range(int(segment['loop'])):
+                    value, time = self._compile(segment['segments'], value, time)
+            else:
+                raise ValueError(f"Segment {index}: unknown segment {segment}")
+        return value, time
+
+    def _add(self, time, length, value, slope):
+        self.starts.append(time)
+        self.ends.append(time + length)
+        self.values.append(value)
+        self.slopes.append(slope)
+
+    def setpoint(self, t):
+        """Setpoint t seconds after the start of the profile"""
+        if not self.starts or t >= self.duration:
+            return self.final
+        i = self.cursor
+        if t < self.starts[i]:
+            # Time went backwards, look the piece up again
+            i = max(bisect.bisect_right(self.starts, t) - 1, 0)
+        while t >= self.ends[i]:
+            i += 1
+        self.cursor = i
+        return self.values[i] + self.slopes[i] * (max(t, 0.0) - self.starts[i])
+
+    def finished(self, t):
+        return t >= self.duration
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the setpoint schedule of a profile file')
+    parser.add_argument('profile')
+    parser.add_argument('--start', type=float, help='starting temperature if the file has none')
+    args = parser.parse_args(argv)
+
+    spec = load_profile(args.profile)
+    start = spec.get('start', args.start)
+    if start is None:
+        parser.error('the profile has no start temperature, give one with --start')
+    profile = Profile(spec['segments'], start)
+    print(f"{'Start':>10}{'End':>10}{'From':>9}{'To':>9}{'°C/min':>9}")
+    for begin, end, value, slope in zip(profile.starts, profile.ends, profile.values, profile.slopes):
+        print(f"{begin:>9.0f}s{end:>9.0f}s{value:>9.2f}{value + slope * (end - begin):>9.2f}{slope * 60:>9.2f}")
+    print(f"Total {profile.duration:.0f}s ({profile.duration / 60:.1f} min), ending at {profile.final:.2f}°C")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
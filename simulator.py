@@ -0,0 +1,289 @@
+import sys
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+
+class PeltierPlant:
+    def __init__(self, ambient=27.6, gain=-4.3, tau=25.0, dead_time=2.0, resistance=4.15, step=0.05):
+        """First-order-plus-dead-time thermal model of the Peltier stage.
+
+        The temperature settles at ambient + gain * voltage with time constant
+        tau seconds, dead_time seconds after the voltage changes. The defaults
+        are fitted by eye to the logged runs: the stage cools by about 4.3 °C
+        per volt and draws about 0.24 A per volt.
+        """
+        self.ambient = ambient
+        self.gain = gain
+        self.tau = tau
+        self.dead_time = dead_time
+        self.resistance = resistance
+        self.step = step
+        self.temperature = ambient
+        self.voltage = 0.0
+        self.time = 0.0
+        self.history = deque([(0.0, 0.0)])
+
+    def set_voltage(self, voltage):
+        """Apply a new voltage from the current simulation time on"""
+        self.voltage = voltage
+        self.history.append((self.time, voltage))
+
+    def delayed_voltage(self):
+        """Voltage that is acting on the temperature now, i.e. applied dead_time ago"""
+        cutoff = self.time - self.dead_time
+        while len(self.history) > 1 and self.history[1][0] <= cutoff:
+            self.history.popleft()
+        return self.history[0][1]
+
+    def current(self):
+        return self.voltage / self.resistance
+
+    def advance(self, seconds):
+        """Integrate the model forward by seconds"""
+        while seconds > 1e-12:
+            h = min(self.step, seconds)
+            steady = self.ambient + self.gain * self.delayed_voltage()
+            self.temperature += (1 - math.exp(-h / self.tau)) * (steady - self.temperature)
+            self.time += h
+            seconds -= h
+
+class SimClock:
+    def __init__(self, *plants, start=None):
+        """Virtual clock with the time module's time(), monotonic() and sleep().
+
+        Sleeping advances the plants instead of waiting, so a run goes as fast
+        as the host can compute it. Sleeps from several threads are charged
+        one after another.
+        """
+        self.plants = list(plants)
+        self.start = time.time() if start is None else start
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.start + self.now
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            for plant in self.plants:
+                plant.advance(seconds)
+            self.now += seconds
+
+class SimPowerSupply:
+    def __init__(self, plant, clock, latency=0.02, noise=0.002, max_voltage=12.0):
+        """Simulated SCPI power supply with the subset of commands main.py uses"""
+        self.plant = plant
+        self.clock = clock
+        self.latency = latency
+        self.noise = noise
+        self.max_voltage = max_voltage
+        self.set_point = 0.0
+        self.output = False
+
+    def _apply(self):
+        self.plant.set_voltage(self.set_point if self.output else 0.0)
+
+    def write(self, command):
+        self.clock.sleep(self.latency)
+        command = command.strip().upper()
+        if command == '*RST':
+            self.set_point = 0.0
+            self.output = False
+        elif command.startswith('VOLT '):
+            self.set_point = max(0.0, min(float(command[5:]), self.max_voltage))
+        elif command == 'OUTP ON':
+            self.output = True
+        elif command == 'OUTP OFF':
+            self.output = False
+        elif command != 'SYST:REM':
+            raise ValueError(f"Unsupported SCPI command: {command}")
+        self._apply()
+
+    def query(self, command):
+        self.clock.sleep(self.latency)
+        replies = []
+        # Several queries can be chained in one message: 'MEAS:VOLT?;:MEAS:CURR?'
+        for part in command.strip().upper().split(';'):
+            part = part.lstrip(':')
+            if part == 'MEAS:VOLT?':
+                value = self.plant.voltage
+            elif part == 'MEAS:CURR?':
+                value = self.plant.current()
+            else:
+                raise ValueError(f"Unsupported SCPI query: {part}")
+            replies.append(f'{value + random.gauss(0, self.noise):.6f}')
+        return ';'.join(replies)
+
+    def close(self):
+        pass
+
+class SimTempLogger:
+    def __init__(self, plant, clock, noise=0.01, resolution=0.03125, latency=0.005, fault_rate=0.0, spike_rate=0.0,
+                 spike=5.0):
+        """Simulated PT100TempLogger: the firmware's latest averaged reading, noisy and quantized.
+
+        fault_rate of the readings are missing and spike_rate are off by up to +-spike °C.
+        """
+        self.plant = plant
+        self.clock = clock
+        self.noise = noise
+        self.resolution = resolution
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.spike_rate = spike_rate
+        self.spike = spike
+
+    def read_temperature(self, blocking=False):
+        self.clock.sleep(self.latency)
+        if self.fault_rate and random.random() < self.fault_rate:
+            return None
+        temperature = self.plant.temperature + random.gauss(0, self.noise)
+        if self.spike_rate and random.random() < self.spike_rate:
+            temperature += random.uniform(-self.spike, self.spike)
+        return round(temperature / self.resolution) * self.resolution
+
+def simulate_batch(kp, ki, kd, target=20.0, duration=300.0, period=1.0, plant=None, direction=-1,
+                   max_voltage=12.0, band=0.5, noise=0.0, seed=None, setpoint_weight=1.0, filter_time=1.0):
+    """Run many PID candidates against the plant model at once.
+
+    kp, ki and kd are broadcast to arrays of candidates; every candidate is
+    stepped with the same arithmetic as pid_utils.PID, including the 0-12 V
+    clamp and back-calculation anti-windup, from the plant at ambient. Returns a dict of
+    per-candidate arrays: iae, ise, overshoot, settling_time (inf if the run
+    ends outside the band) and final_temperature.
+    """
+    import numpy as np
+    plant = plant or PeltierPlant()
+    kp, ki, kd = (a.astype(float).ravel() for a in np.broadcast_arrays(kp, ki, kd))
+    n = kp.size
+    rng = np.random.default_rng(seed)
+
+    steps = int(round(duration / period))
+    delay = int(round(plant.dead_time / period))
+    decay = 1 - math.exp(-period / plant.tau)
+
+    # Back-calculation gain per step, from the default tracking time of PID.set_gains
+    ti = np.divide(kp, ki, out=np.zeros(n), where=ki != 0)
+    td = np.divide(kd, kp, out=np.zeros(n), where=kp != 0)
+    tracking_time = np.where(td > 0, np.sqrt(ti * td), ti)
+    tracking = np.minimum(np.divide(period, tracking_time, out=np.zeros(n), where=tracking_time > 0), 1.0)
+    smoothing = period / (filter_time + period)
+
+    temperature = np.full(n, float(plant.temperature))
+    integral = np.zeros(n)
+    derivative = np.zeros(n)
+    prev_measured = None
+    history = np.zeros((delay + 1, n))
+    approach = 1.0 if plant.temperature >= target else -1.0
+
+    iae = np.zeros(n)
+    ise = np.zeros(n)
+    extreme = temperature.copy()
+    last_outside = np.full(n, -1)
+
+    for k in range(steps):
+        measured = temperature + rng.normal(0, noise, n) if noise else temperature
+        if prev_measured is not None:
+            derivative += smoothing * ((measured - prev_measured) / period - derivative)
+            integral += ki * direction * (target - measured) * period
+        unclamped = kp * direction * (setpoint_weight * target - measured) + integral - direction * kd * derivative
+        output = np.clip(unclamped, 0, max_voltage)
+        if prev_measured is not None:
+            integral += (output - unclamped) * tracking
+        prev_measured = measured.copy()  # temperature is updated in place below
+
+        # Voltage written delay steps ago is the one acting on the plant now
+        history[k % (delay + 1)] = output
+        temperature += decay * (plant.ambient + plant.gain * history[(k + 1) % (delay + 1)] - temperature)
+
+        deviation = temperature - target
+        iae += np.abs(deviation) * period
+        ise += deviation ** 2 * period
+        extreme = np.minimum(extreme, temperature) if approach > 0 else np.maximum(extreme, temperature)
+        last_outside = np.where(np.abs(deviation) > band, k, last_outside)
+
+    settling_time = (last_outside + 1) * period
+    settling_time = np.where(last_outside == steps - 1, np.inf, settling_time)
+    return {
+        'kp': kp,
+        'ki': ki,
+        'kd': kd,
+        'iae': iae,
+        'ise': ise,
+        'overshoot': np.maximum(0.0, approach * (target - extreme)),
+        'settling_time': settling_time,
+        'final_temperature': temperature
+    }
+
+def rank(results, cost='iae'):
+    """Sort every array in a simulate_batch result by the chosen cost, best first"""
+    import numpy as np
+    order = np.argsort(results[cost], kind='stable')
+    return {name: values[order] for name, values in results.items()}
+
+def grid_search(kp_values, ki_values, kd_values, cost='iae', **kwargs):
+    """Simulate every combination of the given gains and rank them"""
+    import numpy as np
+    kp, ki, kd = np.meshgrid(kp_values, ki_values, kd_values, indexing='ij')
+    return rank(simulate_batch(kp, ki, kd, **kwargs), cost)
+
+def random_search(samples, kp_range, ki_range, kd_range, cost='iae', seed=None, **kwargs):
+    """Simulate gains drawn uniformly from the given (low, high) ranges and rank them"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    kp = rng.uniform(*kp_range, samples)
+    ki = rng.uniform(*ki_range, samples)
+    kd = rng.uniform(*kd_range, samples)
+    return rank(simulate_batch(kp, ki, kd, seed=seed, **kwargs), cost)
+
+def parse_range(text):
+    """Parse 'low:high[:count]' into (low, high, count)"""
+    parts = [float(p) for p in text.split(':')]
+    if len(parts) == 2:
+        parts.append(10)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"Expected low:high[:count], got {text}")
+    return parts[0], parts[1], int(parts[2])
+
+def main(argv=None):
+    import numpy as np
+    parser = argparse.ArgumentParser(description='Sweep PID gains against the simulated Peltier stage')
+    parser.add_argument('--kp', type=parse_range, default=(0.1, 3.0, 30), help='low:high[:count]')
+    parser.add_argument('--ki', type=parse_range, default=(0.0, 0.2, 21), help='low:high[:count]')
+    parser.add_argument('--kd', type=parse_range, default=(0.0, 1.0, 11), help='low:high[:count]')
+    parser.add_argument('--random', type=int, metavar='N', help='draw N random candidates instead of the grid')
+    parser.add_argument('--target', type=float, default=20.0)
+    parser.add_argument('--duration', type=float, default=300.0)
+    parser.add_argument('--period', type=float, default=1.0)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument('--cost', default='iae', choices=['iae', 'ise', 'overshoot', 'settling_time'])
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    kwargs = {'target': args.target, 'duration': args.duration, 'period': args.period, 'noise': args.noise}
+    start = time.perf_counter()
+    if args.random:
+        results = random_search(args.random, args.kp[:2], args.ki[:2], args.kd[:2], args.cost, **kwargs)
+    else:
+        results = grid_search(np.linspace(*args.kp), np.linspace(*args.ki), np.linspace(*args.kd),
+                              args.cost, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    print('Kp\tKi\tKd\tIAE\tISE\tOvershoot\tSettling')
+    for i in range(min(args.top, len(results['kp']))):
+        print(f"{results['kp'][i]:.3f}\t{results['ki'][i]:.4f}\t{results['kd'][i]:.3f}\t"
+              f"{results['iae'][i]:.1f}\t{results['ise'][i]:.1f}\t{results['overshoot'][i]:.2f}\t"
+              f"{results['settling_time'][i]:.0f}")
+    print(f"{len(results['kp'])} candidates in {elapsed:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,206 @@
 #include <Adafruit_MAX31865.h>
 #include <SPI.h>
 
-// Use software SPI: CS, DI, DO, CLK
-Adafruit_MAX31865 max = Adafruit_MAX31865(10, 11, 12, 13);
+// Use hardware SPI: CS on pin 10, DI/DO/CLK on the board's SPI pins (11, 12, 13 on an Uno)
+#define MAX31865_CS  10
+Adafruit_MAX31865 max = Adafruit_MAX31865(MAX31865_CS);
 
 // The value of the Rref resistor. Use 430.0 for PT100 and 4300.0 for PT1000
 #define RREF      430.0
 // The 'nominal' 0-degrees-C resistance of the sensor
 #define RNOMINAL  100.0
 
+// Must match the baudrate used by PT100TempLogger / PT100StreamReader
+#define BAUDRATE  115200
+
+// The MAX31865 converts continuously (auto-convert, 50 Hz mains filter, ~21 ms per
+// conversion). Timer1 marks a sample every SAMPLE_PERIOD_MS, and OVERSAMPLE samples
+// are averaged into the value returned by 'r' and sent in stream frames.
+#define SAMPLE_PERIOD_MS  20
+#define OVERSAMPLE        4
+
+// MAX31865 registers, read directly so a sample costs one short SPI transfer
+#define RTD_MSB_REG       0x01
+#define FAULT_STATUS_REG  0x07
+SPISettings maxSpi(1000000, MSBFIRST, SPI_MODE1);
+
+// Binary stream frame, little endian:
+// sync 0xAA 0x55 | seq uint16 | micros uint32 | raw RTD uint16 | fault uint8 | CRC-16/CCITT uint16
+#define FRAME_SYNC1       0xAA
+#define FRAME_SYNC2       0x55
+#define FRAME_PAYLOAD     11
+#define FRAME_SIZE        13
+
+volatile bool sampleDue = false;
+volatile uint32_t sampleMicros = 0;
+
+// Running average of the current window
+uint32_t rtdSum = 0;
+uint8_t rtdCount = 0;
+uint8_t windowSamples = 0;
+uint8_t windowFault = 0;
+
+// Latest averaged reading, ready to send at once
+uint16_t latestRtd = 0;
+uint32_t latestMicros = 0;
+uint8_t latestFault = 0;
+
+bool streaming = false;
+unsigned long streamPeriodMs = 100;  // Frames repeat the latest average if faster than SAMPLE_PERIOD_MS * OVERSAMPLE
+unsigned long lastFrameMs = 0;
+uint16_t sequence = 0;
+
+ISR(TIMER1_COMPA_vect) {
+  sampleMicros = micros();
+  sampleDue = true;
+}
+
+void startSampleTimer() {
+  // Timer1 in CTC mode, prescaler 64: 250 kHz ticks on a 16 MHz board
+  noInterrupts();
+  TCCR1A = 0;
+  TCCR1B = 0;
+  TCNT1 = 0;
+  OCR1A = (F_CPU / 64 / 1000) * SAMPLE_PERIOD_MS - 1;
+  TCCR1B |= (1 << WGM12) | (1 << CS11) | (1 << CS10);
+  TIMSK1 |= (1 << OCIE1A);
+  interrupts();
+}
+
+uint16_t readRegisters(uint8_t address, uint8_t count) {
+  uint16_t value = 0;
+  SPI.beginTransaction(maxSpi);
+  digitalWrite(MAX31865_CS, LOW);
+  SPI.transfer(address);
+  for (uint8_t i = 0; i < count; i++) {
+    value = (value << 8) | SPI.transfer(0xFF);
+  }
+  digitalWrite(MAX31865_CS, HIGH);
+  SPI.endTransaction();
+  return value;
+}
+
+void takeSample(uint32_t timestamp) {
+  // RTD MSB and LSB; bit 0 of the LSB is the fault flag
+  uint16_t value = readRegisters(RTD_MSB_REG, 2);
+  if (value & 1) {
+    // Read the status register as is, a fault detection cycle would interrupt auto-convert
+    windowFault = readRegisters(FAULT_STATUS_REG, 1) | 0x01;  // Bits 1-0 are unused, keep it non-zero
+    max.clearFault();
+  } else {
+    rtdSum += value >> 1;
+    rtdCount++;
+  }
+
+  if (++windowSamples < OVERSAMPLE) {
+    return;
+  }
+  // A window with at least one good sample gives a reading, an all-fault window reports the fault
+  if (rtdCount) {
+    latestRtd = (rtdSum + rtdCount / 2) / rtdCount;
+    latestFault = 0;
+  } else {
+    latestFault = windowFault;
+  }
+  latestMicros = timestamp;
+  rtdSum = 0;
+  rtdCount = 0;
+  windowSamples = 0;
+  windowFault = 0;
+}
+
+uint16_t crc16(const uint8_t *data, uint8_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint32_t timestamp, uint16_t rtd, uint8_t fault) {
+  uint8_t frame[FRAME_SIZE];
+  frame[0] = FRAME_SYNC1;
+  frame[1] = FRAME_SYNC2;
+  frame[2] = sequence & 0xFF;
+  frame[3] = sequence >> 8;
+  frame[4] = timestamp & 0xFF;
+  frame[5] = (timestamp >> 8) & 0xFF;
+  frame[6] = (timestamp >> 16) & 0xFF;
+  frame[7] = timestamp >> 24;
+  frame[8] = rtd & 0xFF;
+  frame[9] = rtd >> 8;
+  frame[10] = fault;
+  uint16_t crc = crc16(frame, FRAME_PAYLOAD);
+  frame[11] = crc & 0xFF;
+  frame[12] = crc >> 8;
+  Serial.write(frame, FRAME_SIZE);
+  sequence++;
+}
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUDRATE);
+  Serial.setTimeout(50);
   max.begin(MAX31865_4WIRE);  // Set to 4WIRE or 2/3WIRE as needed
+  // The filter must be selected before continuous conversions start
+  max.enable50Hz(true);
+  max.enableBias(true);
+  max.autoConvert(true);
+
+  // Fill the first window so 'r' has a value as soon as the host sees READY
+  delay(SAMPLE_PERIOD_MS * 2);
+  for (uint8_t i = 0; i < OVERSAMPLE; i++) {
+    delay(SAMPLE_PERIOD_MS);
+    takeSample(micros());
+  }
+  startSampleTimer();
+
+  // The host waits for this line instead of sleeping after opening the port
+  Serial.println("READY");
 }
 
 void loop() {
+  if (sampleDue) {
+    noInterrupts();
+    uint32_t timestamp = sampleMicros;
+    sampleDue = false;
+    interrupts();
+    takeSample(timestamp);
+  }
+
   if (Serial.available() > 0) {
     char command = Serial.read();
     if (command == 'r') {
-      // Read temperature
-      float temp = max.temperature(RNOMINAL, RREF);
-      
-      // Check for fault
-      uint8_t fault = max.readFault();
-      if (fault) {
+      // Latest average, no conversion to wait for
+      if (latestFault) {
         Serial.println("Fault detected!");
-        max.clearFault();
       } else {
-        Serial.println(temp);
+        Serial.println(max.calculateTemperature(latestRtd, RNOMINAL, RREF), 3);
+      }
+    } else if (command == 's') {
+      // 's<period_ms>\n' starts the binary stream, the period is optional
+      long period = Serial.parseInt();
+      if (period > 0) {
+        streamPeriodMs = period;
       }
+      sequence = 0;
+      streaming = true;
+      lastFrameMs = millis() - streamPeriodMs;
+    } else if (command == 'x') {
+      // Stop streaming
+      streaming = false;
     }
   }
-}
\ No newline at end of file
+
+  if (streaming && millis() - lastFrameMs >= streamPeriodMs) {
+    lastFrameMs += streamPeriodMs;
+    if (millis() - lastFrameMs >= streamPeriodMs) {
+      // Fell behind, keep the sequence gap-free
+      lastFrameMs = millis();
+    }
+    // The timestamp is when the averaged window ended, not when the frame is sent
+    sendFrame(latestMicros, latestRtd, latestFault);
+  }
+}
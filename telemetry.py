@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# State keys exported in Prometheus text format: key -> (metric name, help)
+METRICS = {
+    'elapsed': ('peltier_elapsed_seconds', 'Seconds since the control loop started'),
+    'target': ('peltier_target_celsius', 'Temperature setpoint'),
+    'temperature': ('peltier_temperature_celsius', 'Measured PT100 temperature'),
+    'set_voltage': ('peltier_set_voltage_volts', 'Voltage commanded to the power supply'),
+    'measured_voltage': ('peltier_measured_voltage_volts', 'Voltage measured by the power supply'),
+    'measured_current': ('peltier_measured_current_amperes', 'Current measured by the power supply'),
+    'pid_active': ('peltier_pid_active', '1 once the controller has switched from the ramp to PID'),
+    'cycles': ('peltier_cycles_total', 'Control cycles completed')
+}
+
+class Telemetry:
+    def __init__(self, host='127.0.0.1', port=8765, console_interval=10.0):
+        """Publish the latest control loop state without blocking the loop.
+
+        publish() only replaces a reference. A background HTTP server answers
+        GET /state with JSON and GET /metrics in Prometheus text format, and a
+        background thread prints a one-line summary every console_interval
+        seconds. port=None disables the server, console_interval=None the summary.
+        """
+        self.channels = {}
+        self.updates = 0
+        self.stop_event = threading.Event()
+        self.server = None
+        self.threads = []
+
+        if port is not None:
+            try:
+                self.server = ThreadingHTTPServer((host, port), self._handler())
+                self.server.daemon_threads = True
+                self._start(self.server.serve_forever, 'telemetry-http')
+                print(f"Telemetry at http://{host}:{port}/state and /metrics")
+            except OSError as e:
+                print(f"Telemetry endpoint disabled: {e}")
+                self.server = None
+
+        if console_interval:
+            self.console_interval = console_interval
+            self._start(self._console, 'telemetry-console')
+
+    def _start(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def publish(self, state, channel='main'):
+        """Make state the latest for channel; never blocks on I/O"""
+        self.channels[channel] = state
+        self.updates += 1
+
+    def snapshot(self):
+        """Latest state of every channel"""
+        return dict(self.channels)
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """Latest state of every channel in Prometheus text exposition format"""
+        channels = self.snapshot()
+        lines = []
+        for key, (metric, help_text) in METRICS.items():
+            samples = [(channel, state[key]) for channel, state in channels.items()
+                       if state.get(key) is not None]
+            if not samples:
+                continue
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {"counter" if metric.endswith("_total") else "gauge"}')
+            for channel, value in samples:
+                lines.append(f'{metric}{{channel="{channel}"}} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _handler(self):
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ('/', '/state'):
+                    body, content_type = telemetry.to_json(), 'application/json'
+                elif self.path == '/metrics':
+                    body, content_type = telemetry.to_prometheus(), 'text/plain; version=0.0.4'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _console(self):
+        last_updates = 0
+        while not self.stop_event.wait(self.console_interval):
+            if self.updates != last_updates:
+                last_updates = self.updates
+                print(self.summary())
+
+    def summary(self):
+        """One line per channel describing its latest state"""
+        lines = []
+        for channel, state in self.snapshot().items():
+            temperature = state.get('temperature')
+            clock_time = time.strftime('%H:%M:%S', time.localtime(state['timestamp'])) if 'timestamp' in state else '--:--:--'
+            lines.append(
+                f"[{channel}] {clock_time}  {state.get('elapsed', 0):.1f}s  "
+                f"T {f'{temperature:.2f}°C' if temperature is not None else 'Reading Error'} "
+                f"(target {state.get('target', float('nan')):.2f}°C)  "
+                f"set {state.get('set_voltage', float('nan')):.3f}V  "
+                f"meas {state.get('measured_voltage', float('nan')):.3f}V "
+                f"{state.get('measured_current', float('nan')):.3f}A"
+            )
+        return '\n'.join(lines)
+
+    def close(self):
+        """Stop the console thread and the HTTP server"""
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()